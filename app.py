@@ -2,34 +2,76 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import json
+import os
+import time
 from datetime import datetime
 import pytz
-from streamlit_autorefresh import st_autorefresh
-from data_loader import load_data, standardize_columns
-from styles import apply_gge_styles, render_header
+from functools import partial
+from data_loader import DEFAULT_SHEET_URL, configured_sources
+from exporter import EXPORT_FORMATS, export_bytes
+from figure_cache import figure_cache, plotly_chart_cached
+from kpis import compare_periods, compute_kpis, filter_values
+from refresher import DatasetRefresher
+from shared_dataset import SHARED_DIR, SharedDatasetRefresher
+from instrumentation import incr, record, snapshot, summary, timed
+from styles import apply_gge_styles, favicon, render_header
 
 # --- CONFIGURATION ---
 st.set_page_config(
     page_title="Painel DOT 7 (GGE)",
-    page_icon="assets/favicon.png",
+    page_icon=favicon(),
     layout="wide"
 )
+RERUN_START = time.perf_counter()
 
-# Spreadsheet URL from user
-SHEET_URL = "https://docs.google.com/spreadsheets/d/196o1A0zn6YdDgfENaNbMxoqWEJuc02uzZTz-4yWAJ3U/edit?usp=sharing"
+REFRESH_INTERVAL = 30  # seconds between change probes of the sheet (full fetch only on change)
+VERSION_CHECK_INTERVAL = 5  # seconds between in-browser checks for a new data version
+# Detailed table: rows per page and sortable columns (orders precomputed per version)
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
+TABLE_SORT_OPTIONS = {"Data": 'data_dt', "Unidade": 'unidade', "Status": 'status_code'}
+# Evolution chart: time bucket and moving-average window (in buckets)
+EVOLUTION_GRANULARITIES = {"Dia": 'dia', "Semana": 'semana', "Mês": 'mes', "Ano": 'ano'}
+EVOLUTION_WINDOWS = {"Sem média móvel": None, "Média móvel (3)": 3, "Média móvel (7)": 7, "Média móvel (12)": 12}
+EVOLUTION_DEFAULT = 2  # "Mês"
+# Opt-in performance panel: ?diag=1 in the URL or GGE_DIAGNOSTICS=1
+SHOW_DIAGNOSTICS = os.environ.get("GGE_DIAGNOSTICS") == "1" or st.query_params.get("diag") == "1"
 
+# --- DATA LOADING ---
+@st.cache_resource
+def get_refresher():
+    # One background refresher per server process, shared by every session
+    # Additional tabs/spreadsheets come from [[sources]] in secrets.toml
+    sources = configured_sources(DEFAULT_SHEET_URL)
+    if SHARED_DIR:
+        # Several server processes: one loader, every process maps the same dataset
+        return SharedDatasetRefresher(sources, SHARED_DIR, interval=REFRESH_INTERVAL).start()
+    return DatasetRefresher(sources, interval=REFRESH_INTERVAL).start()
 
-# --- AUTO REFRESH ---
-st_autorefresh(interval=300000, key="datarefresher")
+def get_dataset():
+    refresher = get_refresher()
+    dataset = refresher.latest()
+    if dataset is not None:
+        incr("dataset_hit")
+        return dataset
+    # Cold start without a local snapshot: wait for the first fetch only,
+    # unless an attempt already failed (the page shows the error instead)
+    incr("dataset_miss")
+    if refresher.last_error is not None:
+        return None
+    with st.spinner("Carregando dados da planilha..."), timed("dataset_wait"):
+        dataset = refresher.wait_for_data(timeout=30)
+    return dataset
 
-# --- DATA LOADING ---
-@st.cache_data(ttl=60)  # Reduced TTL for more frequent updates
-def fetch_and_process():
-    raw_df = load_data(SHEET_URL)
-    df = standardize_columns(raw_df)
-    if not df.empty and 'data_dt' in df.columns:
-        df = df.sort_values('data_dt', ascending=False)
-    return df
+# --- AUTO REFRESH ---
+@st.fragment(run_every=VERSION_CHECK_INTERVAL)
+def watch_for_new_version(shown_version):
+    # Only this fragment reruns on the timer (a dict lookup); the full page
+    # reruns only when the refresher has published a newer version.
+    latest = get_refresher().latest()
+    if latest is not None and latest.version != shown_version:
+        incr("push_rerun")
+        st.rerun()
 
 # --- PLOTLY THEME ---
 def apply_plotly_theme(fig):
@@ -46,60 +88,264 @@ def apply_plotly_theme(fig):
         fig.update_yaxes(gridcolor='rgba(255,255,255,0.05)', zeroline=False, showline=False)
     return fig
 
+# --- FIGURES (built only on a figure cache miss) ---
+def build_evolution_figure(rollup, filters, granularity, window):
+    evo_data = rollup.series(granularity, window=window, **filters)
+    fig_line = px.line(evo_data, x='periodo', y='Registros', markers=len(evo_data) <= 60)
+    fig_line.update_traces(
+        line=dict(color='#E31C24', width=3),
+        marker=dict(size=8, color='#0B3D91', line=dict(width=2, color='white')),
+        fill='tozeroy', fillcolor='rgba(227, 28, 36, 0.1)',
+        hovertemplate="<b>Período:</b> %{x}<br><b>Registros:</b> %{y}<extra></extra>"
+    )
+    if window:
+        fig_line.add_trace(go.Scatter(
+            x=evo_data['periodo'], y=evo_data['Média móvel'], mode='lines', name=f"Média móvel ({window})",
+            line=dict(color='#F8FAFC', width=2, dash='dot'),
+            hovertemplate="<b>Média móvel:</b> %{y}<extra></extra>"
+        ))
+    fig_line.update_layout(xaxis_title=None)
+    return apply_plotly_theme(fig_line)
+
+def build_types_figure(cube, cube_slice):
+    occ_types = cube.by_occurrence(cube_slice, top=5).reset_index()
+    occ_types.columns = ['Tipo', 'Total']
+    fig_donut = px.pie(occ_types, values='Total', names='Tipo', hole=0.7)
+    fig_donut.update_traces(
+        textinfo='none', 
+        marker=dict(colors=['#0B3D91', '#E31C24', '#1E293B', '#334155', '#475569']),
+        hovertemplate="<b>Tipo:</b> %{label}<br><b>Total:</b> %{value}<extra></extra>"
+    )
+    return apply_plotly_theme(fig_donut)
+
+def build_units_figure(unit_counts):
+    unit_data = unit_counts.rename('Problemas').reset_index()
+    fig_bar = px.bar(unit_data, x='unidade', y='Problemas', category_orders={"unidade": unit_data['unidade'].tolist()})
+    fig_bar.update_traces(
+        marker_color='#0B3D91', 
+        marker_line_color='#E31C24', 
+        marker_line_width=1.5,
+        hovertemplate="<b>Unidade:</b> %{x}<br><b>Problemas:</b> %{y}<extra></extra>"
+    )
+    return apply_plotly_theme(fig_bar)
+
+def build_status_figure(cube, cube_slice, resolved_count, total_count):
+    status_data = cube.by_status(cube_slice).reset_index()
+    status_data.columns = ['Status', 'Total']
+    fig_status = px.pie(status_data, values='Total', names='Status', hole=0.8)
+    fig_status.update_traces(
+        textinfo='none', 
+        marker=dict(colors=['#0B3D91', '#E31C24']),
+        hovertemplate="<b>Status:</b> %{label}<br><b>Total:</b> %{value}<extra></extra>"
+    )
+    
+    # Center text for donut
+    res_pct = int(resolved_count/total_count*100) if total_count > 0 else 0
+    fig_status.add_annotation(text=f"<b>{res_pct}%</b><br>RESOLVIDO", showarrow=False, font_size=16, font_color="#F8FAFC")
+    return apply_plotly_theme(fig_status)
+
+def evolution_job(dataset, filters, figure_key, granularity, window):
+    return (
+        figure_key + ("evolucao", granularity, window),
+        lambda: build_evolution_figure(dataset.rollup, filters, granularity, window),
+    )
+
+def render_figure(chart, future):
+    # Waits only for this chart; the others keep building on the figure pool
+    with timed("figure_wait", chart=chart) as m:
+        entry, m["cached"] = future.result()
+    with timed("figure_render", chart=chart):
+        plotly_chart_cached(entry)
+
+# --- KPI DELTAS ---
+def kpi_delta(comparison, change, fmt, good_when_up=None):
+    """
+    Delta line under a KPI card value ('▲ 7.0% vs mês anterior'); empty
+    without a comparison period. ``change`` reads the signed delta from the
+    comparison, ``fmt`` formats its magnitude; ``good_when_up`` colors the arrow.
+    """
+    if comparison is None:
+        return ""
+    change = change(comparison)
+    if change is None:
+        return f"<div class='kpi-delta'>sem dados em {comparison.previous_period}</div>"
+    arrow = "▲" if change > 0 else "▼" if change < 0 else "="
+    tone = "" if good_when_up is None or change == 0 else (" good" if (change > 0) == good_when_up else " bad")
+    return (
+        f"<div class='kpi-delta{tone}' title='{comparison.period} x {comparison.previous_period}'>"
+        f"{arrow} {fmt.format(abs(change))} vs {comparison.label}</div>"
+    )
+
+def unit_performance_table(kpis, comparison):
+    """
+    Per-unidade performance with deltas and rank changes against the comparison period.
+    """
+    perf = kpis.unit_performance
+    if comparison is None or perf.empty:
+        return perf
+    deltas = comparison.unit_deltas.set_index('unidade')
+    names = perf['unidade'].astype(str)
+    perf = perf.assign(**{
+        "Δ Total": names.map(deltas['delta_total']).to_numpy(),
+        "Δ Taxa (p.p.)": names.map(deltas['resolved_pct_delta']).to_numpy(),
+        "Posição": names.map(deltas['posicao']).to_numpy(),
+        "Δ Posição": names.map(deltas['delta_posicao']).to_numpy(),
+    })
+    return perf
+
+# --- SECTIONS (fragments: their own widgets rerun only the section) ---
+@st.fragment
+def evolution_section(dataset, filters, figure_key):
+    g_col, w_col = st.columns([2, 1])
+    with g_col:
+        granularity_label = st.radio(
+            "Granularidade", list(EVOLUTION_GRANULARITIES), index=EVOLUTION_DEFAULT, horizontal=True,
+            label_visibility="collapsed", key="evo_granularity"
+        )
+    with w_col:
+        window_label = st.selectbox(
+            "Média móvel", list(EVOLUTION_WINDOWS), label_visibility="collapsed", key="evo_window"
+        )
+    granularity = EVOLUTION_GRANULARITIES[granularity_label]
+    window = EVOLUTION_WINDOWS[window_label]
+    job = evolution_job(dataset, filters, figure_key, granularity, window)
+    render_figure("evolucao", figure_cache.submit({"evolucao": job})["evolucao"])
+
+@st.fragment
+def occurrences_table(dataset, filters, filtered_positions, display_cols):
+    df = dataset.df
+    # Server-side paging: only the visible page is materialized and sent
+    sort_options = {label: col for label, col in TABLE_SORT_OPTIONS.items() if col in dataset.sort_index.orders}
+    t_col1, t_col2, t_col3, t_col4 = st.columns([2, 1, 1, 1])
+    with t_col1:
+        search = st.text_input("🔎 Buscar", placeholder="Unidade, tipo, status ou data", key="table_search")
+    with t_col2:
+        sort_label = st.selectbox("Ordenar por", list(sort_options) or ["Padrão"], key="table_sort")
+    with t_col3:
+        descending = st.selectbox("Ordem", ["Decrescente", "Crescente"], key="table_order") == "Decrescente"
+    with t_col4:
+        page_size = st.selectbox("Linhas por página", TABLE_PAGE_SIZES, index=1, key="table_page_size")
+
+    with timed("table_page") as m:
+        rows = dataset.sort_index.rows(
+            df, filtered_positions, sort_by=sort_options.get(sort_label),
+            descending=descending, search=search, search_cols=display_cols
+        )
+        n_pages = max(1, -(-len(rows) // page_size))
+        # A new query starts on page 1; a data refresh keeps the current page
+        query = (tuple(filters.values()), search, sort_label, descending, page_size)
+        if st.session_state.get("table_query") != query:
+            st.session_state["table_query"] = query
+            st.session_state["table_page"] = 1
+        elif st.session_state.get("table_page", 1) > n_pages:
+            st.session_state["table_page"] = n_pages
+        page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, step=1, key="table_page")
+        start = (page - 1) * page_size
+        page_df = df.take(rows[start:start + page_size])[display_cols]
+        m["rows"] = len(rows)
+
+    st.dataframe(page_df, use_container_width=True, hide_index=True)
+    st.caption(
+        f"Exibindo {start + 1 if len(rows) else 0}–{start + len(page_df)} de {len(rows)} ocorrências"
+    )
+
 # --- UI INITIALIZATION ---
 apply_gge_styles()
 render_header()
 
-df = fetch_and_process()
+dataset = get_dataset()
+df = dataset.df if dataset is not None else pd.DataFrame()
+watch_for_new_version(dataset.version if dataset is not None else None)
 
 if df.empty:
-    st.warning("⚠️ Aguardando carregamento de dados ou verifique as credenciais.")
-    st.info("💡 Certifique-se de que a planilha está configurada como pública e a aba se chama 'Página1'.")
+    load_error = get_refresher().last_error
+    if load_error:
+        st.error(f"❌ Falha ao carregar os dados: {load_error}")
+        st.info("💡 Dica: Verifique as credenciais em st.secrets, a URL da planilha e se o acesso foi compartilhado com o e-mail da conta de serviço.")
+    else:
+        st.warning("⚠️ Aguardando carregamento de dados ou verifique as credenciais.")
+        st.info("💡 Certifique-se de que a planilha está configurada como pública e a aba se chama 'Página1'.")
 else:
-    # Identify key columns
-    occ_col = next((c for c in df.columns if 'OCORR' in c.upper()), None)
-    status_col = next((c for c in df.columns if 'STATUS' in c.upper()), None)
+    # Key columns and the pre-aggregated cube are resolved once per data version
+    occ_col = dataset.occ_col
+    status_col = dataset.status_col
+    cube = dataset.cube
 
     # --- FILTERS TOOLBAR ---
     st.markdown("<div class='filter-bar'>", unsafe_allow_html=True)
     f_col1, f_col2, f_col3, f_col4 = st.columns([1, 1, 1, 0.8])
     
     with f_col1:
-        anos = ["Todos os anos"] + sorted([str(x) for x in df['ano'].unique().tolist()]) if 'ano' in df.columns else ["Todos os anos"]
+        anos = ["Todos os anos"] + filter_values(dataset, 'ano')
         selected_year = st.selectbox("📅 Ano", anos)
     
     with f_col2:
-        month_order = [
-            "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
-            "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
-        ]
-        available_months = sorted(df['mes'].unique().tolist(), key=lambda m: month_order.index(m) if m in month_order else 99) if 'mes' in df.columns else []
-        meses = ["Todos os meses"] + available_months
+        meses = ["Todos os meses"] + filter_values(dataset, 'mes')
         selected_month = st.selectbox("📆 Mês", meses)
         
     with f_col3:
-        unidades = ["Todas as unidades"] + sorted(df['unidade'].unique().tolist()) if 'unidade' in df.columns else ["Todas as unidades"]
+        unidades = ["Todas as unidades"] + filter_values(dataset, 'unidade')
         selected_unit = st.selectbox("🏢 Unidade", unidades)
         
-    # Apply Filtering
-    filtered_df = df.copy()
-    if selected_year != "Todos os anos":
-        filtered_df = filtered_df[filtered_df['ano'].astype(str) == selected_year]
-    if selected_month != "Todos os meses":
-        filtered_df = filtered_df[filtered_df['mes'] == selected_month]
-    if selected_unit != "Todas as unidades":
-        filtered_df = filtered_df[filtered_df['unidade'] == selected_unit]
+    # Apply Filtering (None = no filter on that dimension)
+    filters = {
+        'ano': None if selected_year == "Todos os anos" else selected_year,
+        'mes': None if selected_month == "Todos os meses" else selected_month,
+        'unidade': None if selected_unit == "Todas as unidades" else selected_unit,
+    }
+    # Row positions via the bitmap index (no frame copy), aggregates via the cube
+    with timed("filter", **filters) as m:
+        filtered_positions = dataset.index.positions(**filters)
+        cube_slice = cube.slice(**filters)
+        m["rows"] = len(df) if filtered_positions is None else len(filtered_positions)
+    # Same engine as the headless KPI endpoint (kpi_server.py)
+    kpis = compute_kpis(dataset, **filters)
+    # Period-over-period deltas (a year or month must be selected), from per-month totals
+    comparisons = compare_periods(dataset, **filters)
+    comparison = comparisons[0] if comparisons else None
+    total_count = kpis.total
+    resolved_count = kpis.resolved
+    unit_counts = cube.by_unit(cube_slice)
+
+    # Chart builds start now on the figure pool, in page order, while the KPI
+    # cards (computed above from the cube) are rendered; each chart section
+    # below waits only for its own figure. Serialized figures are shared by
+    # every session viewing the same data and filters.
+    figure_key = (dataset.source, dataset.version, selected_year, selected_month, selected_unit)
+    figure_jobs = {}
+    if 'data_dt' in df.columns:
+        figure_jobs["evolucao"] = evolution_job(
+            dataset, filters, figure_key,
+            EVOLUTION_GRANULARITIES[st.session_state.get("evo_granularity", list(EVOLUTION_GRANULARITIES)[EVOLUTION_DEFAULT])],
+            EVOLUTION_WINDOWS[st.session_state.get("evo_window", next(iter(EVOLUTION_WINDOWS)))],
+        )
+    if occ_col:
+        figure_jobs["tipos"] = (figure_key + ("tipos",), lambda: build_types_figure(cube, cube_slice))
+    if 'unidade' in df.columns:
+        figure_jobs["unidades"] = (figure_key + ("unidades",), lambda: build_units_figure(unit_counts))
+    if status_col:
+        figure_jobs["status"] = (
+            figure_key + ("status",),
+            lambda: build_status_figure(cube, cube_slice, resolved_count, total_count)
+        )
+    figures = figure_cache.submit(figure_jobs)
 
     with f_col4:
         st.markdown("<div style='margin-top: 28px;'></div>", unsafe_allow_html=True)
-        csv = filtered_df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📊 Exportar CSV",
-            data=csv,
-            file_name=f"relatorio_gge_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime='text/csv',
-            use_container_width=True
-        )
+        # Files are encoded only when a button is clicked (deferred data),
+        # never on a plain rerun, and cached per data version + filters
+        export_stamp = datetime.now().strftime('%Y%m%d')
+        with st.popover("📊 Exportar", use_container_width=True):
+            for fmt, (label, mime, extension) in EXPORT_FORMATS.items():
+                st.download_button(
+                    label=label,
+                    data=partial(export_bytes, dataset, dict(filters), fmt),
+                    file_name=f"relatorio_gge_{export_stamp}.{extension}",
+                    mime=mime,
+                    on_click="ignore",
+                    key=f"export_{fmt}",
+                    use_container_width=True
+                )
     st.markdown("</div>", unsafe_allow_html=True)
 
     # --- KPI CARDS ---
@@ -113,17 +359,17 @@ else:
                         <span class='kpi-label'>Total Registros</span>
                         <i class='fas fa-database kpi-icon'></i>
                     </div>
-                    <div class='kpi-value'>{len(filtered_df)}</div>
+                    <div class='kpi-value'>{total_count}</div>
                     <div class='kpi-subtext'>ocorrências registradas</div>
+                    {kpi_delta(comparison, lambda c: c.total_change_pct, "{:.1f}%")}
                 </div>
                 <span class='tooltiptext'>Volume total de entradas com base nos filtros selecionados.</span>
             </div>
         """, unsafe_allow_html=True)
         
     with k2:
-        if status_col:
-            resolved_pct = (len(filtered_df[filtered_df[status_col].astype(str).str.upper() == 'RESOLVIDO']) / len(filtered_df) * 100) if len(filtered_df) > 0 else 0
-            val = f"{resolved_pct:.1f}%"
+        if kpis.resolved_pct is not None:
+            val = f"{kpis.resolved_pct:.1f}%"
         else:
             val = "N/A"
         st.markdown(f"""
@@ -135,13 +381,13 @@ else:
                     </div>
                     <div class='kpi-value'>{val}</div>
                     <div class='kpi-subtext'>taxa de finalização</div>
+                    {kpi_delta(comparison, lambda c: c.resolved_pct_change, "{:.1f} p.p.", good_when_up=True)}
                 </div>
                 <span class='tooltiptext'>Percentual de ocorrências marcadas como 'RESOLVIDO'.</span>
             </div>
         """, unsafe_allow_html=True)
         
     with k3:
-        n_units = filtered_df['unidade'].nunique() if 'unidade' in filtered_df.columns else 0
         st.markdown(f"""
             <div class='tooltip'>
                 <div class='kpi-card'>
@@ -149,15 +395,22 @@ else:
                         <span class='kpi-label'>Unidades</span>
                         <i class='fas fa-school kpi-icon'></i>
                     </div>
-                    <div class='kpi-value'>{n_units}</div>
+                    <div class='kpi-value'>{kpis.units}</div>
                     <div class='kpi-subtext'>campus com dados</div>
+                    {kpi_delta(comparison, lambda c: c.units - c.previous_units, "{}")}
                 </div>
                 <span class='tooltiptext'>Quantidade de unidades escolares diferentes representadas nos dados.</span>
             </div>
         """, unsafe_allow_html=True)
         
     with k4:
-        top_u = filtered_df['unidade'].value_counts().idxmax() if not filtered_df.empty and 'unidade' in filtered_df.columns else "-"
+        top_unit_delta = ""
+        if comparison is not None and comparison.previous_top_unit:
+            same = comparison.previous_top_unit == kpis.top_unit
+            top_unit_delta = (
+                f"<div class='kpi-delta'>{'mantida' if same else 'antes: ' + comparison.previous_top_unit} "
+                f"vs {comparison.label}</div>"
+            )
         st.markdown(f"""
             <div class='tooltip'>
                 <div class='kpi-card'>
@@ -165,8 +418,9 @@ else:
                         <span class='kpi-label'>Principal Unidade</span>
                         <i class='fas fa-star kpi-icon'></i>
                     </div>
-                    <div class='kpi-value' style='font-size: 1.5rem;'>{top_u}</div>
+                    <div class='kpi-value' style='font-size: 1.5rem;'>{kpis.top_unit or '-'}</div>
                     <div class='kpi-subtext'>maior volume registrado</div>
+                    {top_unit_delta}
                 </div>
                 <span class='tooltiptext'>A unidade com o maior número total de ocorrências.</span>
             </div>
@@ -182,20 +436,9 @@ else:
             <div class='chart-card'>
                 <div class='chart-title'><i class='fas fa-chart-line'></i> Evolução Temporal</div>
         """, unsafe_allow_html=True)
-        if 'data_dt' in filtered_df.columns:
-            evolution_df = filtered_df.copy()
-            evolution_df['mes_ano'] = evolution_df['data_dt'].dt.strftime('%b/%y')
-            evolution_df = evolution_df.sort_values('data_dt')
-            evo_data = evolution_df.groupby('mes_ano', sort=False).size().reset_index(name='Registros')
-            
-            fig_line = px.line(evo_data, x='mes_ano', y='Registros', markers=True)
-            fig_line.update_traces(
-                line=dict(color='#E31C24', width=3),
-                marker=dict(size=8, color='#0B3D91', line=dict(width=2, color='white')),
-                fill='tozeroy', fillcolor='rgba(227, 28, 36, 0.1)',
-                hovertemplate="<b>Mês:</b> %{x}<br><b>Registros:</b> %{y}<extra></extra>"
-            )
-            st.plotly_chart(apply_plotly_theme(fig_line), use_container_width=True)
+        if "evolucao" in figures:
+            # The prefetched figure (current widget values) is reused by the fragment
+            evolution_section(dataset, filters, figure_key)
         else:
             st.info("Dados temporais necessários para evolução.")
         st.markdown("</div>", unsafe_allow_html=True)
@@ -205,16 +448,8 @@ else:
             <div class='chart-card'>
                 <div class='chart-title'><i class='fas fa-list-ul'></i> Tipos Frequentes</div>
         """, unsafe_allow_html=True)
-        if occ_col:
-            occ_types = filtered_df[occ_col].value_counts().head(5).reset_index()
-            occ_types.columns = ['Tipo', 'Total']
-            fig_donut = px.pie(occ_types, values='Total', names='Tipo', hole=0.7)
-            fig_donut.update_traces(
-                textinfo='none', 
-                marker=dict(colors=['#0B3D91', '#E31C24', '#1E293B', '#334155', '#475569']),
-                hovertemplate="<b>Tipo:</b> %{label}<br><b>Total:</b> %{value}<extra></extra>"
-            )
-            st.plotly_chart(apply_plotly_theme(fig_donut), use_container_width=True)
+        if "tipos" in figures:
+            render_figure("tipos", figures["tipos"])
         st.markdown("</div>", unsafe_allow_html=True)
 
     # --- ROW 2: Problems by Unit & General Status ---
@@ -225,16 +460,8 @@ else:
             <div class='chart-card'>
                 <div class='chart-title'><i class='fas fa-chart-bar'></i> Volume por Unidade</div>
         """, unsafe_allow_html=True)
-        if 'unidade' in filtered_df.columns:
-            unit_data = filtered_df.groupby('unidade').size().reset_index(name='Problemas').sort_values('Problemas', ascending=False)
-            fig_bar = px.bar(unit_data, x='unidade', y='Problemas', category_orders={"unidade": unit_data['unidade'].tolist()})
-            fig_bar.update_traces(
-                marker_color='#0B3D91', 
-                marker_line_color='#E31C24', 
-                marker_line_width=1.5,
-                hovertemplate="<b>Unidade:</b> %{x}<br><b>Problemas:</b> %{y}<extra></extra>"
-            )
-            st.plotly_chart(apply_plotly_theme(fig_bar), use_container_width=True)
+        if "unidades" in figures:
+            render_figure("unidades", figures["unidades"])
         st.markdown("</div>", unsafe_allow_html=True)
 
     with r2_c2:
@@ -242,23 +469,8 @@ else:
             <div class='chart-card'>
                 <div class='chart-title'><i class='fas fa-circle-notch'></i> Status das Demandas</div>
         """, unsafe_allow_html=True)
-        if status_col:
-            status_data = filtered_df[status_col].value_counts().reset_index()
-            status_data.columns = ['Status', 'Total']
-            fig_status = px.pie(status_data, values='Total', names='Status', hole=0.8)
-            fig_status.update_traces(
-                textinfo='none', 
-                marker=dict(colors=['#0B3D91', '#E31C24']),
-                hovertemplate="<b>Status:</b> %{label}<br><b>Total:</b> %{value}<extra></extra>"
-            )
-            
-            # Center text for donut
-            resolved_count = len(filtered_df[filtered_df[status_col].astype(str).str.upper() == 'RESOLVIDO'])
-            total_count = len(filtered_df)
-            res_pct = int(resolved_count/total_count*100) if total_count > 0 else 0
-            fig_status.add_annotation(text=f"<b>{res_pct}%</b><br>RESOLVIDO", showarrow=False, font_size=16, font_color="#F8FAFC")
-            
-            st.plotly_chart(apply_plotly_theme(fig_status), use_container_width=True)
+        if "status" in figures:
+            render_figure("status", figures["status"])
         st.markdown("</div>", unsafe_allow_html=True)
 
     # --- ROW 3: Data Tables ---
@@ -267,27 +479,61 @@ else:
     with tab1:
         st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
         display_cols = ['data', 'unidade', occ_col, status_col]
-        display_cols = [c for c in display_cols if c in filtered_df.columns]
-        st.dataframe(filtered_df[display_cols], use_container_width=True, hide_index=True)
+        display_cols = [c for c in display_cols if c in df.columns]
+
+        occurrences_table(dataset, filters, filtered_positions, display_cols)
         st.markdown("</div>", unsafe_allow_html=True)
 
     with tab2:
         st.markdown("<div class='glass-card'>", unsafe_allow_html=True)
-        if 'unidade' in filtered_df.columns:
-            perf_df = filtered_df.groupby('unidade').agg(Total=('unidade', 'count')).reset_index()
-            if status_col:
-                norms = filtered_df[filtered_df[status_col].astype(str).str.upper() == 'RESOLVIDO'].groupby('unidade').size().reset_index(name='Resolvidos')
-                perf_df = perf_df.merge(norms, on='unidade', how='left').fillna(0)
-                perf_df['Taxa %'] = (perf_df['Resolvidos'] / perf_df['Total'] * 100).round(1).astype(str) + "%"
-            st.dataframe(perf_df, use_container_width=True, hide_index=True)
+        if 'unidade' in df.columns:
+            st.dataframe(
+                unit_performance_table(kpis, comparison),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Taxa %": st.column_config.NumberColumn(format="%.1f%%"),
+                    "Δ Total": st.column_config.NumberColumn(format="%+d"),
+                    "Δ Taxa (p.p.)": st.column_config.NumberColumn(format="%+.1f"),
+                    "Posição": st.column_config.NumberColumn(format="%dº"),
+                    "Δ Posição": st.column_config.NumberColumn(format="%+d", help="Positivo = subiu no ranking de volume"),
+                }
+            )
+            if comparison is not None:
+                st.caption(f"Variações de {comparison.period} em relação a {comparison.label} ({comparison.previous_period}).")
         st.markdown("</div>", unsafe_allow_html=True)
 
     # Footer with timezone correction
     brazil_tz = pytz.timezone('America/Sao_Paulo')
     now_br = datetime.now(brazil_tz)
-    
+
+    # Stale-while-revalidate: the last good version stays on screen during outages
+    refresher = get_refresher()
+    if refresher.is_stale():
+        data_time = datetime.fromtimestamp(dataset.fetched_at, brazil_tz)
+        st.warning(
+            f"⚠️ Não foi possível atualizar a planilha ({refresher.last_error}). "
+            f"Exibindo dados de {data_time.strftime('%d/%m/%Y %H:%M:%S')}; nova tentativa em andamento."
+        )
+
     st.markdown(f"""
         <div style='text-align: center; color: #94A3B8; font-size: 0.8em; margin-top: 40px; border-top: 1px solid rgba(255,255,255,0.05); padding-top: 20px;'>
             <i class='fas fa-clock'></i> Última atualização: {now_br.strftime('%d/%m/%Y %H:%M:%S')} | <b>GGE BI Solution</b>
         </div>
     """, unsafe_allow_html=True)
+
+# --- DIAGNOSTICS (opt-in) ---
+record("rerun", time.perf_counter() - RERUN_START)
+if SHOW_DIAGNOSTICS:
+    with st.expander("🩺 Diagnóstico de desempenho", expanded=False):
+        metrics = snapshot()
+        memory = f" · RSS {metrics['rss_mb']} MB · pico {metrics['peak_rss_mb']} MB" if metrics['rss_mb'] is not None else ""
+        st.caption(f"PID {metrics['pid']}{memory}")
+        st.dataframe(pd.DataFrame(summary()), use_container_width=True, hide_index=True)
+        st.json({**metrics['counters'], 'figure_cache': figure_cache.stats()})
+        st.download_button(
+            label="Baixar métricas (JSON)",
+            data=json.dumps(metrics, default=str),
+            file_name="metricas_gge.json",
+            mime="application/json"
+        )
@@ -0,0 +1,146 @@
+"""
+Benchmarks the load -> standardize -> filter -> aggregate pipeline against a
+local fake worksheet.
+
+    python -m benchmarks.bench_pipeline --rows 10000 100000 1000000
+    python -m benchmarks.bench_pipeline --rows 50000 --units 20 --types 30 --json bench.json
+"""
+import argparse
+import gc
+import itertools
+import json
+import logging
+import time
+import tracemalloc
+import pandas as pd
+import data_loader
+from benchmarks.fake_sheets import FakeWorksheet, generate_rows, install
+from refresher import DatasetVersion, prepare_dataset
+
+SHEET_URL = "https://docs.google.com/spreadsheets/d/benchmark/edit"
+
+class StageTimer:
+    """
+    Collects wall time and (optionally) peak traced memory per stage.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(self, stage, fn, *args, **kwargs):
+        gc.collect()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results.append({'stage': stage, 'seconds': elapsed, 'peak_mb': peak / 2**20})
+        return result
+
+def _filter_combinations(dataset, limit):
+    """
+    A deterministic sample of (ano, mes, unidade) selections, 'all' included.
+    """
+    values = []
+    for dim in ('ano', 'mes', 'unidade'):
+        options = [None]
+        if dim in dataset.df.columns:
+            options += dataset.df[dim].cat.categories.tolist()[:4]
+        values.append(options)
+    combos = [dict(zip(('ano', 'mes', 'unidade'), c)) for c in itertools.product(*values)]
+    return combos[:limit]
+
+def _filter_all(dataset, combos):
+    return [len(dataset.index.take(dataset.df, **f)) for f in combos]
+
+def _aggregate_all(dataset, combos):
+    cube = dataset.cube
+    out = []
+    for f in combos:
+        sl = cube.slice(**f)
+        out.append((
+            cube.total(sl), cube.resolved(sl), cube.by_unit(sl), cube.by_status(sl),
+            cube.by_occurrence(sl, top=5), cube.unit_performance(sl),
+            dataset.rollup.series('mes', **f), dataset.rollup.series('dia', window=7, **f),
+        ))
+    return out
+
+def _build_version(df):
+    return DatasetVersion(version=1, df=prepare_dataset(df), fetched_at=time.time(), source=SHEET_URL).warm()
+
+def run_benchmark(n_rows, n_units, n_types, seed=0, trace_memory=True, combos=64, append_fraction=0.01):
+    """
+    Runs every stage once for a sheet of ``n_rows`` and returns the results.
+    """
+    data_loader._sync_state.clear()
+    data_loader._date_memo.clear()
+    rows = generate_rows(n_rows, n_units=n_units, n_types=n_types, seed=seed)
+    worksheet = FakeWorksheet(rows)
+    install(worksheet)
+    timer = StageTimer(trace_memory=trace_memory)
+
+    timer.run('fetch_full (get_all_records, old)', lambda: pd.DataFrame(worksheet.get_all_records()))
+    timer.run('fetch_full (raw values)', data_loader.load_data, SHEET_URL)
+    raw = timer.run('fetch_incremental (cold)', data_loader.load_data, SHEET_URL, incremental=True)
+    std = timer.run('standardize (cold)', data_loader.standardize_columns, raw, cache_key=SHEET_URL)
+
+    appended = generate_rows(max(1, int(n_rows * append_fraction)), n_units=n_units, n_types=n_types, seed=seed + 1)[1:]
+    worksheet.append_rows(appended)
+    raw = timer.run(f'fetch_incremental (+{len(appended)} rows)', data_loader.load_data, SHEET_URL, incremental=True)
+    std = timer.run('standardize (memoized dates)', data_loader.standardize_columns, raw, cache_key=SHEET_URL)
+
+    dataset = timer.run('prepare version (sort+cube+indexes+rollup)', _build_version, std)
+    selections = _filter_combinations(dataset, combos)
+    timer.run(f'filter x{len(selections)} (bitmap index)', _filter_all, dataset, selections)
+    timer.run(f'aggregate x{len(selections)} (cube+rollup)', _aggregate_all, dataset, selections)
+
+    return {
+        'rows': n_rows,
+        'units': n_units,
+        'types': n_types,
+        'dataset_mb': dataset.df.memory_usage(deep=True).sum() / 2**20,
+        'cube_rows': len(dataset.cube.counts),
+        'upstream_calls': dict(worksheet.calls),
+        'stages': timer.results,
+    }
+
+def print_report(result):
+    print(f"\n== {result['rows']:,} rows | {result['units']} unidades | {result['types']} tipos "
+          f"| dataset {result['dataset_mb']:.1f} MB | cube {result['cube_rows']:,} rows ==")
+    print(f"{'stage':<40} {'wall (s)':>10} {'peak (MB)':>10}")
+    for r in result['stages']:
+        print(f"{r['stage']:<40} {r['seconds']:>10.3f} {r['peak_mb']:>10.1f}")
+    print(f"upstream calls: {result['upstream_calls']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--units', type=int, default=12)
+    parser.add_argument('--types', type=int, default=15)
+    parser.add_argument('--combos', type=int, default=64, help='filter selections replayed per stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc (faster, no peak memory)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    # st.info/st.error from data_loader have no session here
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    results = []
+    for n_rows in args.rows:
+        result = run_benchmark(n_rows, args.units, args.types, seed=args.seed,
+                               trace_memory=not args.no_memory, combos=args.combos)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
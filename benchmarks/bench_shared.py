@@ -0,0 +1,93 @@
+"""
+Runs the multi-process shared-memory mode locally: this process is the elected
+loader (fetching from the fake Sheets endpoint) and N spawned worker processes
+map the published dataset. Reports per-process memory (RSS and PSS, where
+shared pages are split between the processes mapping them) and how long a new
+version takes to reach every worker.
+
+    python -m benchmarks.bench_shared --rows 200000 --workers 4
+"""
+import argparse
+import logging
+import multiprocessing as mp
+import tempfile
+import time
+import data_loader
+import resilience
+import snapshot_store
+from benchmarks.fake_sheets import FakeSheetsAdapter, FakeWorksheet, fake_http_client, fake_sheet_url, generate_rows
+from shared_dataset import SharedDatasetRefresher
+
+SPREADSHEET_ID = "sharedbench"
+
+def _memory_mb():
+    """
+    (RSS, PSS) of the current process in MB, from /proc/self/smaps_rollup.
+    """
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values.get("Rss", 0.0), values.get("Pss", 0.0)
+
+def _worker(shared_dir, url, results, target_version):
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    refresher = SharedDatasetRefresher([url], shared_dir, sync_interval=0.05).start()
+    dataset = refresher.wait_for_data(timeout=60)
+    rss, pss = _memory_mb()
+    results.put(('ready', dataset.version, len(dataset.df), refresher.is_loader, rss, pss, time.time()))
+    while refresher.latest().version < target_version:
+        time.sleep(0.01)
+    results.put(('updated', refresher.latest().version, len(refresher.latest().df), refresher.is_loader, 0, 0, time.time()))
+    refresher.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--append', type=int, default=1_000, help='rows appended to trigger the second version')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    shared_dir = tempfile.mkdtemp(prefix='gge-shared-')
+    snapshot_store.SNAPSHOT_DIR = tempfile.mkdtemp(prefix='gge-snap-')
+    resilience.sheets_limiter = resilience.TokenBucket(60_000)
+
+    worksheet = FakeWorksheet(generate_rows(args.rows))
+    data_loader.reset_gspread_client(fake_http_client(FakeSheetsAdapter({SPREADSHEET_ID: [worksheet]})))
+    url = fake_sheet_url(SPREADSHEET_ID)
+
+    loader = SharedDatasetRefresher([url], shared_dir, interval=3600, sync_interval=0.05).start()
+    dataset = loader.wait_for_data(timeout=120)
+    private_mb = snapshot_store.read_snapshot(loader.source_key)[0].memory_usage(deep=True).sum() / 2**20
+    print(f"loader pid is_loader={loader.is_loader} version={dataset.version} rows={len(dataset.df):,}")
+
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    target = dataset.version + 1
+    workers = [ctx.Process(target=_worker, args=(shared_dir, url, results, target)) for _ in range(args.workers)]
+    for w in workers:
+        w.start()
+    ready = [results.get(timeout=120) for _ in workers]
+
+    worksheet.append_rows(generate_rows(args.append, seed=1)[1:])
+    published_at = time.time()
+    loader.refresh_now()
+    updated = [results.get(timeout=60) for _ in workers]
+    for w in workers:
+        w.join()
+
+    print(f"private pandas copy of the dataset: {private_mb:,.1f} MB per process")
+    print(f"{'worker':<8}{'version':>8}{'rows':>10}{'loader':>8}{'RSS MB':>10}{'PSS MB':>10}")
+    for i, (_, version, rows, is_loader, rss, pss, _) in enumerate(ready):
+        print(f"{i:<8}{version:>8}{rows:>10,}{str(is_loader):>8}{rss:>10.1f}{pss:>10.1f}")
+    lag = max(r[6] for r in updated) - published_at
+    versions = sorted({r[1] for r in updated})
+    print(f"version {target} published -> seen by all {len(updated)} workers in {lag * 1000:.0f} ms "
+          f"(versions {versions}, rows {updated[0][2]:,})")
+    loader.stop()
+
+if __name__ == '__main__':
+    main()
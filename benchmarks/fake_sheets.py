@@ -0,0 +1,349 @@
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+import gspread
+import requests
+from gspread.utils import a1_range_to_grid_range
+from requests.adapters import BaseAdapter
+
+# Header variations exercised by standardize_columns' mapping
+HEADER_VARIANTS = {
+    'data': ['Data', 'DATE', 'Timestamp', 'Criado em', 'created_at', 'Horário'],
+    'unidade': ['Unidade', 'Campus', 'Unidade Escolar', 'ESCOLA', 'unidade_escolar', 'Local'],
+    'ocorrencia': ['Ocorrência', 'OCORRENCIA', 'Tipo de Ocorrência', 'Ocorrências'],
+    'status': ['Status', 'STATUS', 'Status da Demanda'],
+}
+STATUSES = ['Resolvido', 'RESOLVIDO', 'Pendente', 'Em andamento', ' resolvido ']
+# Formatted date cells as generate_rows writes them, and the Sheets serial-date origin
+DATE_CELL = re.compile(r"^(\d{2})/(\d{2})/(\d{4})(?: (\d{2}):(\d{2}))?$")
+SHEETS_EPOCH = datetime(1899, 12, 30)
+
+def generate_rows(n_rows, n_units=8, n_types=12, seed=0, messy_headers=True, start=None):
+    """
+    Synthetic occurrence sheet as the Sheets API returns it: a header row
+    followed by rows of formatted strings.
+    """
+    rng = random.Random(seed)
+    if messy_headers:
+        header = [rng.choice(HEADER_VARIANTS[k]) for k in ('data', 'unidade', 'ocorrencia', 'status')]
+    else:
+        header = ['Data', 'Unidade', 'Ocorrência', 'Status']
+    header += ['Descrição', 'Responsável']
+
+    units = [f"Unidade {i:02d}" for i in range(n_units)]
+    # Untidy spellings of the same unit, normalized by standardize_columns
+    unit_spellings = {u: [u, u.upper(), f" {u.lower()} "] for u in units}
+    types = [f"Tipo {i:02d}" for i in range(n_types)]
+    start = start or datetime(2023, 2, 1, 7, 0)
+    span = 3 * 365 * 24 * 60
+
+    rows = [header]
+    for i in range(n_rows):
+        ts = start + timedelta(minutes=int(span * i / max(n_rows, 1)) + rng.randint(0, 59))
+        unit = rng.choice(units)
+        rows.append([
+            ts.strftime('%d/%m/%Y %H:%M'),
+            rng.choice(unit_spellings[unit]),
+            rng.choice(types),
+            rng.choice(STATUSES),
+            f"Registro {i}",
+            rng.choice(['Ana', 'Bruno', 'Carla', 'Diego', '']),
+        ])
+    return rows
+
+def unformatted_value(value):
+    """
+    What the API returns for a formatted cell with UNFORMATTED_VALUE and
+    SERIAL_NUMBER: dates as serial day numbers, numbers as JSON numbers.
+    """
+    if not isinstance(value, str):
+        return value
+    match = DATE_CELL.match(value)
+    if match:
+        day, month, year, hour, minute = match.groups()
+        ts = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0))
+        serial = (ts - SHEETS_EPOCH) / timedelta(days=1)
+        return int(serial) if serial.is_integer() else serial
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def _trim(matrix):
+    """
+    Mimics the Sheets API: trailing empty cells and rows are omitted.
+    """
+    out = []
+    for row in matrix:
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        out.append(row)
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+class FakeWorksheet:
+    """
+    Local stand-in for gspread.Worksheet backed by an in-memory list of rows.
+    Implements the read calls used by data_loader and counts them.
+    ``latency`` (seconds) is added to every call to emulate the network.
+    Change the rows through ``append_rows`` (the unformatted rendering of
+    existing rows is cached).
+    """
+
+    def __init__(self, rows, title="Página1", latency=0.0):
+        self.rows = rows
+        self.title = title
+        self.latency = latency
+        self.calls = {}
+        self.modified_time = datetime.now(timezone.utc).isoformat()
+        self._unformatted = []
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+        self.modified_time = datetime.now(timezone.utc).isoformat()
+
+    def edit_cell(self, row, col, value):
+        """
+        Edits one cell in place, as a user would (0-based; row 0 is the header).
+        """
+        with self._lock:
+            self.rows[row][col] = value
+            if row < len(self._unformatted):
+                self._unformatted[row][col] = unformatted_value(value)
+        self.modified_time = datetime.now(timezone.utc).isoformat()
+
+    def unformatted_rows(self):
+        with self._lock:
+            for row in self.rows[len(self._unformatted):]:
+                self._unformatted.append([unformatted_value(v) for v in row])
+            return self._unformatted
+
+    def _range(self, a1, unformatted=False):
+        rows = self.unformatted_rows() if unformatted else self.rows
+        if not a1:
+            return _trim(rows)
+        grid = a1_range_to_grid_range(a1)
+        r0, r1 = grid.get('startRowIndex', 0), grid.get('endRowIndex', len(rows))
+        c0, c1 = grid.get('startColumnIndex', 0), grid.get('endColumnIndex', None)
+        return _trim([r[c0:c1] for r in rows[r0:r1]])
+
+    @staticmethod
+    def _is_unformatted(kwargs):
+        return kwargs.get('value_render_option') == gspread.utils.ValueRenderOption.unformatted
+
+    def get(self, range_name=None, **kwargs):
+        self._call('get')
+        return self._range(range_name, self._is_unformatted(kwargs))
+
+    def get_values(self, range_name=None, **kwargs):
+        self._call('get_values')
+        values = self._range(range_name, self._is_unformatted(kwargs))
+        width = max((len(r) for r in values), default=0)
+        return [list(r) + [""] * (width - len(r)) for r in values]
+
+    def get_all_records(self, **kwargs):
+        self._call('get_all_records')
+        header, *rows = self.rows
+        return [dict(zip(header, gspread.utils.numericise_all(list(r)))) for r in rows]
+
+    def batch_get(self, ranges, **kwargs):
+        self._call('batch_get')
+        return [self._range(a1, self._is_unformatted(kwargs)) for a1 in ranges]
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets):
+        self._worksheets = worksheets
+
+    def worksheet(self, title):
+        for ws in self._worksheets:
+            if ws.title == title:
+                return ws
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    def worksheets(self):
+        return list(self._worksheets)
+
+    def get_lastUpdateTime(self):
+        return max(ws.modified_time for ws in self._worksheets)
+
+class FakeClient:
+    """
+    Stand-in for an authorized gspread client: every URL opens the same
+    spreadsheet unless ``spreadsheets`` maps URLs explicitly.
+    """
+
+    def __init__(self, spreadsheet, spreadsheets=None):
+        self.spreadsheet = spreadsheet
+        self.spreadsheets = spreadsheets or {}
+
+    def open_by_url(self, url):
+        return self.spreadsheets.get(url, self.spreadsheet)
+
+def install(worksheet):
+    """
+    Points data_loader at a fake client serving ``worksheet``; returns the client.
+    """
+    import data_loader
+    client = FakeClient(FakeSpreadsheet([worksheet]))
+    data_loader.get_gspread_client = lambda: client
+    return client
+
+def fake_sheet_url(spreadsheet_id):
+    return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
+
+class FakeSheetsAdapter(BaseAdapter):
+    """
+    In-process HTTP endpoint for the Sheets v4 / Drive v3 routes gspread uses
+    (metadata, values get, values batchGet, modifiedTime), serving
+    ``{spreadsheet_id: [FakeWorksheet, ...]}``.
+
+    Mounted on a real gspread session, the whole client stack (retries, rate
+    limiting, JSON decoding) runs unchanged. Faults are injected per request:
+    ``latency`` seconds of delay plus jitter, ``error_rate`` chance of
+    answering one of ``error_statuses``, and ``fail_all`` to emulate an outage.
+    """
+
+    SHEET_ROUTE = re.compile(r"/v4/spreadsheets/([^/:]+)(?:/values(?:/(.+)|:batchGet))?$")
+    DRIVE_ROUTE = re.compile(r"/drive/v3/files/([^/]+)$")
+
+    def __init__(self, spreadsheets, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_statuses=(429, 503), retry_after=None, seed=0):
+        super().__init__()
+        self.spreadsheets = spreadsheets
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.retry_after = retry_after
+        self.fail_all = False
+        self.requests = 0
+        self.errors = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests += 1
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self.fail_all or self._rng.random() < self.error_rate
+            status = self._rng.choice(self.error_statuses) if fail else None
+        try:
+            if delay:
+                time.sleep(delay)
+            if status is not None:
+                with self._lock:
+                    self.errors += 1
+                return self._error(request, status, "Injected fault")
+            return self._route(request)
+        finally:
+            with self._lock:
+                self.concurrent -= 1
+
+    def close(self):
+        pass
+
+    def _route(self, request):
+        url = urlsplit(request.url)
+        query = parse_qs(url.query)
+        drive = self.DRIVE_ROUTE.search(url.path)
+        if drive:
+            worksheets = self.spreadsheets.get(drive.group(1))
+            if worksheets is None:
+                return self._error(request, 404, "File not found")
+            modified = max(ws.modified_time for ws in worksheets)
+            return self._json(request, {"id": drive.group(1), "modifiedTime": modified})
+
+        match = self.SHEET_ROUTE.search(url.path)
+        worksheets = self.spreadsheets.get(match.group(1)) if match else None
+        if worksheets is None:
+            return self._error(request, 404, "Requested entity was not found.")
+        unformatted = query.get("valueRenderOption") == ["UNFORMATTED_VALUE"]
+        if match.group(2):
+            return self._json(request, self._values(worksheets, unquote(match.group(2)), unformatted))
+        if url.path.endswith(":batchGet"):
+            return self._json(request, {
+                "spreadsheetId": match.group(1),
+                "valueRanges": [self._values(worksheets, r, unformatted) for r in query.get("ranges", [])],
+            })
+        return self._json(request, self._metadata(match.group(1), worksheets))
+
+    @staticmethod
+    def _metadata(spreadsheet_id, worksheets):
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "properties": {"title": f"Fake {spreadsheet_id}", "locale": "pt_BR", "timeZone": "America/Sao_Paulo"},
+            "sheets": [
+                {"properties": {
+                    "sheetId": i,
+                    "title": ws.title,
+                    "index": i,
+                    "sheetType": "GRID",
+                    "gridProperties": {"rowCount": max(len(ws.rows), 1000), "columnCount": 26},
+                }}
+                for i, ws in enumerate(worksheets)
+            ],
+        }
+
+    @staticmethod
+    def _values(worksheets, range_name, unformatted=False):
+        title, _, a1 = range_name.rpartition("!")
+        if not title:
+            title, a1 = a1, ""
+        title = title.strip("'")
+        ws = next((w for w in worksheets if w.title == title), worksheets[0])
+        ws._call('values')
+        values = ws._range(a1, unformatted)
+        body = {"range": range_name, "majorDimension": "ROWS"}
+        if values:
+            body["values"] = values
+        return body
+
+    @staticmethod
+    def _response(request, status, payload, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(payload).encode("utf-8")
+        response.headers["Content-Type"] = "application/json; charset=UTF-8"
+        response.headers.update(headers or {})
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def _json(self, request, payload):
+        return self._response(request, 200, payload)
+
+    def _error(self, request, status, message):
+        headers = {"Retry-After": str(self.retry_after)} if status == 429 and self.retry_after else None
+        return self._response(request, status, {"error": {"code": status, "message": message, "status": "FAKE"}}, headers)
+
+def fake_http_client(adapter):
+    """
+    A real gspread client (with data_loader's resilient HTTP layer) whose
+    session talks to ``adapter`` instead of Google.
+    """
+    from resilience import ResilientHTTPClient
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return gspread.Client(None, session=session, http_client=ResilientHTTPClient)
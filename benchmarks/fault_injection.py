@@ -0,0 +1,245 @@
+"""
+Exercises the resilient fetch path (retry/backoff, rate limiter, request
+coalescing, stale-while-revalidate, change probes, union of sources with
+and without a status column) against the local fake Sheets endpoint with
+injected latency and errors. Prints one line per scenario and exits
+non-zero if any expectation fails.
+
+    python -m benchmarks.fault_injection
+    python -m benchmarks.fault_injection --rows 20000 --error-rate 0.4 --latency 0.05
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import threading
+import time
+import data_loader
+import resilience
+import snapshot_store
+from benchmarks.fake_sheets import FakeSheetsAdapter, FakeWorksheet, fake_http_client, fake_sheet_url, generate_rows
+from instrumentation import counters
+from kpis import compute_kpis
+from refresher import DatasetRefresher, DatasetVersion, prepare_dataset
+from snapshot_store import mixed_object_columns
+
+SPREADSHEET_ID = "faultinjection"
+
+def _delta(before, name):
+    return counters().get(name, 0) - before.get(name, 0)
+
+def _reset(adapter):
+    data_loader._sync_state.clear()
+    data_loader._date_memo.clear()
+    adapter.requests = adapter.errors = adapter.max_concurrent = 0
+
+def scenario_flaky(adapter, url, refreshes):
+    """
+    Every refresh succeeds although a share of the requests fail.
+    """
+    before = counters()
+    ok = 0
+    for _ in range(refreshes):
+        ok += not data_loader.refresh_snapshot([url]).empty
+    return {
+        'passed': ok == refreshes and adapter.errors > 0,
+        'refreshes_ok': f"{ok}/{refreshes}",
+        'requests': adapter.requests,
+        'injected_errors': adapter.errors,
+        'retries': _delta(before, 'sheets_retries'),
+    }
+
+def scenario_coalescing(adapter, url, callers):
+    """
+    Concurrent refreshes of the same sources share one in-flight fetch.
+    """
+    before = counters()
+    barrier = threading.Barrier(callers)
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(len(data_loader.refresh_snapshot([url])))
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    coalesced = _delta(before, 'fetch_coalesced')
+    return {
+        'passed': len(set(results)) == 1 and coalesced > 0,
+        'callers': callers,
+        'coalesced': coalesced,
+        'requests': adapter.requests,
+    }
+
+def scenario_rate_limit(adapter, url, per_minute, calls):
+    """
+    Bursts beyond the bucket are spread out instead of hitting the API at once.
+    """
+    previous = resilience.sheets_limiter
+    resilience.sheets_limiter = resilience.TokenBucket(per_minute, burst=2)
+    client = data_loader.get_gspread_client()
+    before = counters()
+    start = time.perf_counter()
+    try:
+        for _ in range(calls):
+            client.http_client.fetch_sheet_metadata(SPREADSHEET_ID)
+    finally:
+        resilience.sheets_limiter = previous
+    elapsed = time.perf_counter() - start
+    # The first two calls use the burst, the rest wait 60/per_minute each
+    expected = (calls - 2) * 60 / per_minute
+    return {
+        'passed': elapsed >= expected * 0.9,
+        'calls': calls,
+        'elapsed_s': round(elapsed, 2),
+        'min_expected_s': round(expected, 2),
+        'throttled_s': round(_delta(before, 'sheets_throttled_seconds'), 2),
+    }
+
+def scenario_outage(adapter, url):
+    """
+    During an outage the last version keeps being served and flagged stale;
+    the next successful refresh clears the flag (and, the data being
+    unchanged, keeps the same version).
+    """
+    refresher = DatasetRefresher([url], interval=3600)
+    healthy = refresher.refresh_now()
+    adapter.fail_all = True
+    try:
+        refresher.refresh_now()
+        failed = False
+    except Exception:
+        failed = True
+    finally:
+        adapter.fail_all = False
+    served = refresher.latest()
+    stale = refresher.is_stale()
+    error = refresher.last_error or ''
+    recovered = refresher.refresh_now()
+    return {
+        'passed': failed and served is healthy and stale and not refresher.is_stale() and recovered is healthy,
+        'served_version': served.version,
+        'stale_flagged': stale,
+        'last_error': error[:60],
+        'recovered_version': recovered.version,
+    }
+
+def scenario_change_probe(adapter, url, worksheet):
+    """
+    With the Drive probe and with the sentinel-row fallback: one append
+    publishes exactly one version; "Pendente" rows edited back in the
+    sheet show up in one more version (on the next poll with the Drive
+    probe, within FULL_SYNC_EVERY max-age resyncs with the sentinel); and
+    the max-age resync of unchanged data publishes nothing.
+    """
+    published = {}
+    # Each mode edits its own range of old rows (the worksheet is shared)
+    for mode, edit_rows in (('drive', range(600, 2000)), ('sentinel', range(2000, 3400))):
+        _reset(adapter)
+        if mode == 'sentinel':
+            data_loader._drive_probe_unavailable.add(SPREADSHEET_ID)
+        try:
+            refresher = DatasetRefresher([url], interval=3600)
+            first = refresher.poll().version
+            worksheet.append_rows(generate_rows(1, seed=len(worksheet.rows), messy_headers=False)[1:])
+            for _ in range(3):
+                refresher.poll()
+            appended = refresher.latest().version - first
+
+            # Old rows (outside the tail and the first checksum blocks) resolved in place
+            resolved = compute_kpis(refresher.latest()).resolved
+            pending = [r for r in edit_rows if r < len(worksheet.rows) and worksheet.rows[r][3] == 'Pendente']
+            for r in pending:
+                worksheet.edit_cell(r, 3, 'RESOLVIDO')
+            if mode == 'sentinel':
+                refresher.max_age = 0
+            before_edit = refresher.latest().version
+            for _ in range(1 if mode == 'drive' else data_loader.FULL_SYNC_EVERY):
+                refresher.poll()
+            edited = refresher.latest().version - before_edit
+            caught = pending and compute_kpis(refresher.latest()).resolved - resolved == len(pending)
+
+            refresher.max_age = 0
+            before_resync = refresher.latest().version
+            refresher.poll()
+            resynced = refresher.latest().version - before_resync
+        finally:
+            data_loader._drive_probe_unavailable.discard(SPREADSHEET_ID)
+        published[mode] = (appended, edited if caught else 0, resynced)
+    return {
+        'passed': all(counts == (1, 1, 0) for counts in published.values()),
+        **{f"{mode}_versions": "append={} edit={} resync={}".format(*counts) for mode, counts in published.items()},
+    }
+
+def scenario_mixed_sources(adapter, url, rows):
+    """
+    A source without a status column unioned with one that has it: rows of
+    the former count as not resolved and the flag stays boolean, so the
+    KPIs and the snapshot keep working.
+    """
+    other_id = f"{SPREADSHEET_ID}-sem-status"
+    no_status = [[cell for i, cell in enumerate(row) if i != 3] for row in generate_rows(rows, seed=1)]
+    adapter.spreadsheets[other_id] = [FakeWorksheet(no_status)]
+    try:
+        df = data_loader.load_sources([url, fake_sheet_url(other_id)])
+    finally:
+        del adapter.spreadsheets[other_id]
+    kpis = compute_kpis(DatasetVersion(1, prepare_dataset(df), 0, url))
+    return {
+        'passed': df['is_resolved'].dtype == bool and not mixed_object_columns(df) and kpis.resolved is not None,
+        'rows': len(df),
+        'is_resolved': df['is_resolved'].dtype,
+        'resolved': kpis.resolved,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.02, help='extra random latency (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.3, help='share of requests answered with 429/503')
+    parser.add_argument('--refreshes', type=int, default=10)
+    parser.add_argument('--callers', type=int, default=8, help='concurrent refreshes for the coalescing scenario')
+    parser.add_argument('--rate', type=int, default=240, help='limiter rate (req/min) for the rate-limit scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    logging.getLogger('refresher').setLevel(logging.CRITICAL)
+    snapshot_store.SNAPSHOT_DIR = tempfile.mkdtemp(prefix='gge-faults-')
+    # Short backoff windows and no global throttling so the run takes seconds
+    resilience.RETRY_BASE_WAIT = 0.05
+    resilience.sheets_limiter = resilience.TokenBucket(60_000)
+
+    worksheet = FakeWorksheet(generate_rows(args.rows, seed=args.seed))
+    adapter = FakeSheetsAdapter(
+        {SPREADSHEET_ID: [worksheet]},
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed,
+    )
+    data_loader.reset_gspread_client(fake_http_client(adapter))
+    url = fake_sheet_url(SPREADSHEET_ID)
+
+    scenarios = [
+        ('retry/backoff', lambda: scenario_flaky(adapter, url, args.refreshes)),
+        ('coalescing', lambda: scenario_coalescing(adapter, url, args.callers)),
+        ('rate limit', lambda: scenario_rate_limit(adapter, url, args.rate, 8)),
+        ('stale-while-revalidate', lambda: scenario_outage(adapter, url)),
+        ('change probe', lambda: scenario_change_probe(adapter, url, worksheet)),
+        ('mixed sources', lambda: scenario_mixed_sources(adapter, url, args.rows)),
+    ]
+    failures = 0
+    for name, run in scenarios:
+        _reset(adapter)
+        result = run()
+        failures += not result['passed']
+        details = ", ".join(f"{k}={v}" for k, v in result.items() if k != 'passed')
+        print(f"{'OK  ' if result['passed'] else 'FAIL'} {name:<24} {details}")
+
+    data_loader.reset_gspread_client()
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
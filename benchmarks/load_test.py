@@ -0,0 +1,512 @@
+"""
+Load test of the dashboard as many viewers see it. Starts the real Streamlit
+server (in a subprocess) on the fake Sheets backend and drives N concurrent
+sessions over the Streamlit websocket protocol, like open browser tabs and
+wall screens: every session loads the page and follows the auto-refresh
+ticks the server schedules (the new-version watcher); interactive viewers
+also change a filter every few seconds. Rows are appended to the sheet
+periodically, so new versions get pushed to every open session at once.
+
+Reports client-side rerun latency percentiles per kind (page load, filter
+change, auto-refresh tick, pushed rerun) and the time until the KPI cards
+arrive. It also reports server CPU and memory, upstream Sheets requests
+and cache hit rates.
+
+    python -m benchmarks.load_test --sessions 30 --duration 60
+    python -m benchmarks.load_test --sessions 60 --wall-screens 0.5 --rows 200000 --append-every 20 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPREADSHEET_ID = "loadtest"
+FILTER_LABELS = ["📅 Ano", "📆 Mês", "🏢 Unidade"]
+# Seconds between server metric dumps / process samples
+METRICS_INTERVAL = 0.5
+# A rerun not finished by then is counted as timed out
+RERUN_TIMEOUT = 120
+# Server-side stages reported from the metrics log (GGE_METRICS_LOG)
+SERVER_STAGES = ('rerun', 'figure_build', 'table_page', 'sheets_fetch_all', 'standardize')
+
+# --- SERVER (subprocess) ---
+def _dump_metrics(path, adapter):
+    from figure_cache import figure_cache
+    from instrumentation import counters
+    while True:
+        payload = {
+            'time': time.time(),
+            'counters': counters(),
+            'upstream_requests': adapter.requests,
+            'figure_cache': figure_cache.stats(),
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+        time.sleep(METRICS_INTERVAL)
+
+def _append_rows(worksheet, every, n_rows):
+    from benchmarks.fake_sheets import generate_rows
+    seed = 1
+    while True:
+        time.sleep(every)
+        worksheet.append_rows(generate_rows(n_rows, seed=seed)[1:])
+        seed += 1
+
+def serve(args):
+    """
+    Runs app.py in this process with data_loader pointed at the fake backend.
+    """
+    os.chdir(ROOT)
+    import data_loader
+    import snapshot_store
+    from streamlit.web import bootstrap
+    from benchmarks.fake_sheets import FakeSheetsAdapter, FakeWorksheet, fake_http_client, fake_sheet_url, generate_rows
+
+    snapshot_store.SNAPSHOT_DIR = os.path.join(args.work_dir, "snapshots")
+    worksheet = FakeWorksheet(generate_rows(args.rows))
+    adapter = FakeSheetsAdapter({SPREADSHEET_ID: [worksheet]}, latency=args.latency, jitter=args.latency)
+    data_loader.reset_gspread_client(fake_http_client(adapter))
+    url = fake_sheet_url(SPREADSHEET_ID)
+    # app.py reads both at every rerun (ignores [[sources]] in a local secrets.toml)
+    data_loader.DEFAULT_SHEET_URL = url
+    data_loader.configured_sources = lambda default_url: data_loader.normalize_sources([url])
+
+    threading.Thread(target=_dump_metrics, args=(args.metrics_file, adapter), daemon=True).start()
+    if args.append_every:
+        threading.Thread(
+            target=_append_rows, args=(worksheet, args.append_every, args.append_rows), daemon=True
+        ).start()
+
+    flags = {
+        'server.port': args.port,
+        'server.address': "127.0.0.1",
+        'server.headless': True,
+        'server.fileWatcherType': "none",
+        'browser.gatherUsageStats': False,
+    }
+    bootstrap.load_config_options(flag_options=flags)
+    bootstrap.run(os.path.join(ROOT, "app.py"), False, [], flags)
+
+# --- SERVER PROCESS SAMPLING ---
+class ProcessMonitor:
+    """
+    Samples CPU time and memory (RSS, PSS) of the server process from /proc.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self._ticks
+        memory = {}
+        with open(f"/proc/{self.pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    memory[key] = int(rest.split()[0]) / 1024
+        return time.monotonic(), cpu, memory.get("Rss", 0.0), memory.get("Pss", 0.0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.samples.append(self._read())
+            except OSError:
+                return
+            self._stop.wait(METRICS_INTERVAL)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        if len(self.samples) < 2:
+            return {}
+        (t0, c0, _, _), (t1, c1, _, _) = self.samples[0], self.samples[-1]
+        cpu = [
+            (b[1] - a[1]) / (b[0] - a[0]) * 100
+            for a, b in zip(self.samples, self.samples[1:]) if b[0] > a[0]
+        ]
+        return {
+            'cpu_mean_pct': round((c1 - c0) / (t1 - t0) * 100, 1),
+            'cpu_max_pct': round(max(cpu), 1),
+            'rss_max_mb': round(max(s[2] for s in self.samples), 1),
+            'pss_max_mb': round(max(s[3] for s in self.samples), 1),
+            'rss_end_mb': round(self.samples[-1][2], 1),
+        }
+
+# --- VIEWER SESSIONS ---
+class Viewer:
+    """
+    One browser tab: speaks the Streamlit websocket protocol (BackMsg
+    rerun requests, ForwardMsg deltas) without rendering anything. Keeps the
+    filter selectboxes it has seen, the fragment auto-rerun schedule and
+    the cacheable message hashes a browser would report.
+    """
+
+    def __init__(self, url, rng, interactive, think_time, results):
+        self.url = url
+        self.rng = rng
+        self.interactive = interactive
+        self.think_time = think_time
+        self.results = results
+        self.page_hash = ""
+        self.selectboxes = {}
+        self.selection = {}
+        self.auto_reruns = {}
+        self.cached_hashes = set()
+        self.errors = 0
+        self._run = None
+
+    async def session(self, deadline):
+        from tornado.httpclient import HTTPRequest
+        from tornado.websocket import websocket_connect
+        request = HTTPRequest(self.url, headers={"Sec-WebSocket-Protocol": "streamlit"})
+        self.ws = await websocket_connect(request, max_message_size=256 * 2**20)
+        reader = asyncio.ensure_future(self._read())
+        try:
+            await self._rerun("carga")
+            next_filter = time.monotonic() + self._think()
+            next_ticks = {fid: time.monotonic() + interval for fid, interval in self.auto_reruns.items()}
+            while time.monotonic() < deadline and not reader.done():
+                for fid, interval in self.auto_reruns.items():
+                    next_ticks.setdefault(fid, time.monotonic() + interval)
+                due = min([next_filter] + list(next_ticks.values()))
+                await asyncio.sleep(max(0.0, min(due, deadline) - time.monotonic()))
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if now >= next_filter:
+                    self._change_filter()
+                    await self._rerun("filtro")
+                    next_filter = time.monotonic() + self._think()
+                for fid, at in list(next_ticks.items()):
+                    if now >= at:
+                        await self._rerun("tick", fragment_id=fid)
+                        next_ticks[fid] = time.monotonic() + self.auto_reruns.get(fid, 0)
+                        if fid not in self.auto_reruns:
+                            del next_ticks[fid]
+        finally:
+            self.ws.close()
+            reader.cancel()
+
+    def _think(self):
+        if not self.interactive:
+            return float("inf")
+        return self.rng.expovariate(1 / self.think_time)
+
+    def _change_filter(self):
+        choices = [label for label in FILTER_LABELS if label in self.selectboxes]
+        if choices:
+            label = self.rng.choice(choices)
+            self.selection[label] = self.rng.choice(self.selectboxes[label][1])
+
+    def _client_state(self, fragment_id=None):
+        from streamlit.proto.ClientState_pb2 import ClientState
+        state = ClientState(query_string="", page_script_hash=self.page_hash)
+        for label, value in self.selection.items():
+            widget_id, options = self.selectboxes[label]
+            if value in options:
+                widget = state.widget_states.widgets.add()
+                widget.id = widget_id
+                widget.string_value = value
+        if fragment_id:
+            state.fragment_id = fragment_id
+            state.is_auto_rerun = True
+        state.cached_message_hashes.extend(self.cached_hashes)
+        return state
+
+    async def _rerun(self, kind, fragment_id=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        msg = BackMsg()
+        msg.rerun_script.CopyFrom(self._client_state(fragment_id))
+        self._run = {
+            'kind': kind, 'start': time.monotonic(), 'kpis': None, 'full': False,
+            'bytes': 0, 'cached_refs': 0, 'done': asyncio.get_running_loop().create_future(),
+        }
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        run = self._run
+        try:
+            status = await asyncio.wait_for(asyncio.shield(run['done']), RERUN_TIMEOUT)
+        except asyncio.TimeoutError:
+            status = "timeout"
+        if kind == "tick" and run['full']:
+            kind = "push"  # the watcher saw a new version and reran the page
+        self.results.append({
+            'kind': kind,
+            'seconds': time.monotonic() - run['start'],
+            'kpi_seconds': run['kpis'] - run['start'] if run['kpis'] else None,
+            'status': status,
+            'bytes': run['bytes'],
+            'cached_refs': run['cached_refs'],
+        })
+
+    async def _read(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                return
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            run = self._run
+            if run is not None:
+                run['bytes'] += len(raw)
+            if msg.metadata.cacheable and msg.hash:
+                self.cached_hashes.add(msg.hash)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = msg.new_session.page_script_hash
+                if run is not None and not msg.new_session.fragment_ids_this_run:
+                    run['full'] = True
+                    self.auto_reruns.clear()
+            elif kind == "ref_hash" and run is not None:
+                run['cached_refs'] += 1
+            elif kind == "auto_rerun":
+                self.auto_reruns[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._on_element(msg.delta.new_element, run)
+            elif kind == "script_finished" and run is not None:
+                status = ForwardMsg.ScriptFinishedStatus.Name(msg.script_finished)
+                if status != "FINISHED_EARLY_FOR_RERUN" and not run['done'].done():
+                    run['done'].set_result(status)
+
+    def _on_element(self, element, run):
+        kind = element.WhichOneof("type")
+        if kind == "selectbox" and element.selectbox.label in FILTER_LABELS:
+            self.selectboxes[element.selectbox.label] = (element.selectbox.id, list(element.selectbox.options))
+        elif kind == "markdown" and "kpi-value" in element.markdown.body:
+            if run is not None and run['kpis'] is None:
+                run['kpis'] = time.monotonic()
+        elif kind == "exception":
+            self.errors += 1
+
+# --- REPORT ---
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def _latency_table(results):
+    rows = []
+    for kind in ("carga", "filtro", "tick", "push"):
+        values = sorted(r['seconds'] for r in results if r['kind'] == kind and r['status'] != "timeout")
+        if not values:
+            continue
+        kpis = sorted(r['kpi_seconds'] for r in results if r['kind'] == kind and r['kpi_seconds'] is not None)
+        rows.append({
+            'kind': kind,
+            'count': len(values),
+            'p50_ms': _percentile(values, 0.50) * 1000,
+            'p90_ms': _percentile(values, 0.90) * 1000,
+            'p99_ms': _percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000,
+            'kpis_p50_ms': _percentile(kpis, 0.50) * 1000 if kpis else None,
+            'kpis_p90_ms': _percentile(kpis, 0.90) * 1000 if kpis else None,
+            'kb_mean': sum(r['bytes'] for r in results if r['kind'] == kind) / len(values) / 1024,
+        })
+    return rows
+
+def _hit_rate(counters, hit, miss):
+    total = counters.get(hit, 0) + counters.get(miss, 0)
+    return round(counters.get(hit, 0) / total * 100, 1) if total else None
+
+def _server_stages(log_path, since):
+    """
+    Percentiles of the server's own stage timings recorded after ``since``.
+    """
+    by_stage = {}
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event['ts'] >= since and event['stage'] in SERVER_STAGES and event['seconds'] is not None:
+                by_stage.setdefault(event['stage'], []).append(event['seconds'])
+    stats = {}
+    for stage in SERVER_STAGES:
+        values = sorted(by_stage.get(stage, []))
+        if values:
+            stats[stage] = {
+                'count': len(values),
+                'p50_ms': _percentile(values, 0.50) * 1000,
+                'p95_ms': _percentile(values, 0.95) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+    return stats
+
+def _server_delta(before, after):
+    counters = {k: v - before['counters'].get(k, 0) for k, v in after['counters'].items()}
+    return {
+        'upstream_requests': after['upstream_requests'] - before['upstream_requests'],
+        'versions_published': counters.get('versions_published', 0),
+        'change_probes': counters.get('change_probes', 0),
+        'push_reruns': counters.get('push_rerun', 0),
+        'figure_cache_hit_pct': _hit_rate(counters, 'figure_cache_hit', 'figure_cache_miss'),
+        'dataset_hit_pct': _hit_rate(counters, 'dataset_hit', 'dataset_miss'),
+        'export_cache_hit_pct': _hit_rate(counters, 'export_cache_hit', 'export_cache_miss'),
+        'coalesced': counters.get('fetch_coalesced', 0),
+        'figure_cache': after['figure_cache'],
+        'counters': counters,
+    }
+
+def print_report(latency, server, process, driver_cpu, args, errors, timeouts):
+    print(f"\n{args.sessions} sessões ({round(args.sessions * args.wall_screens)} telas de parede), "
+          f"{args.duration:.0f} s, {args.rows:,} linhas")
+    print(f"{'tipo':<8}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'KPIs p50':>10}{'KPIs p90':>10}{'KB/rerun':>10}")
+    for row in latency:
+        kpis = [f"{row[k]:>10.0f}" if row[k] is not None else f"{'-':>10}" for k in ('kpis_p50_ms', 'kpis_p90_ms')]
+        print(f"{row['kind']:<8}{row['count']:>6}{row['p50_ms']:>10.0f}{row['p90_ms']:>10.0f}{row['p99_ms']:>10.0f}"
+              f"{row['max_ms']:>10.0f}{''.join(kpis)}{row['kb_mean']:>10.1f}")
+    if timeouts or errors:
+        print(f"timeouts: {timeouts}  exceções no app: {errors}")
+    for stage, s in server['stages'].items():
+        print(f"servidor {stage:<17} n={s['count']:<6} p50 {s['p50_ms']:>6.0f} ms  p95 {s['p95_ms']:>6.0f} ms  max {s['max_ms']:>6.0f} ms")
+    if process:
+        print(f"servidor CPU média {process['cpu_mean_pct']}% (pico {process['cpu_max_pct']}%)  "
+              f"RSS pico {process['rss_max_mb']} MB  PSS pico {process['pss_max_mb']} MB")
+    print(f"requisições à planilha: {server['upstream_requests']}  versões publicadas: {server['versions_published']}  "
+          f"reruns por nova versão: {server['push_reruns']}")
+    print(f"cache de gráficos: {server['figure_cache_hit_pct']}% acertos  dataset em memória: {server['dataset_hit_pct']}% acertos")
+    print(f"CPU do gerador de carga: {driver_cpu}% (acima de ~90% o cliente vira o gargalo)")
+
+# --- DRIVER ---
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_healthy(port, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou com código {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Servidor não respondeu a tempo")
+
+def _read_metrics(path):
+    for _ in range(20):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            time.sleep(METRICS_INTERVAL)
+    raise RuntimeError(f"Métricas do servidor indisponíveis em {path}")
+
+async def _drive(args, url):
+    rng = random.Random(args.seed)
+    results = []
+    # Warm-up: the first page load waits for the cold fetch; measured apart
+    warmup = Viewer(url, rng, False, args.think_time, [])
+    await warmup.session(time.monotonic())
+    metrics_before = _read_metrics(args.metrics_file)
+
+    n_walls = round(args.sessions * args.wall_screens)
+    viewers = [
+        Viewer(url, random.Random(rng.random()), i >= n_walls, args.think_time, results)
+        for i in range(args.sessions)
+    ]
+    deadline = time.monotonic() + args.ramp + args.duration
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+
+    async def start(viewer, delay):
+        await asyncio.sleep(delay)
+        await viewer.session(deadline)
+
+    await asyncio.gather(*(start(v, args.ramp * i / max(1, args.sessions)) for i, v in enumerate(viewers)))
+    elapsed = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    driver_cpu = round((after.ru_utime + after.ru_stime - usage.ru_utime - usage.ru_stime) / elapsed * 100, 1)
+    return results, viewers, metrics_before, driver_cpu
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=20, help='concurrent viewer sessions')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load after the ramp-up')
+    parser.add_argument('--ramp', type=float, default=5, help='seconds over which sessions connect')
+    parser.add_argument('--wall-screens', type=float, default=0.3, help='share of sessions that never touch the filters')
+    parser.add_argument('--think-time', type=float, default=10, help='mean seconds between filter changes (interactive viewers)')
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--append-every', type=float, default=30, help='seconds between rows appended to the sheet (0 = never)')
+    parser.add_argument('--append-rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every fake Sheets request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    # Internal: the server subprocess
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--metrics-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='gge-load-')
+    args.port = _free_port()
+    args.metrics_file = os.path.join(work_dir, "server-metrics.json")
+    log_path = os.path.join(work_dir, "server.log")
+    metrics_log = os.path.join(work_dir, "server-events.jsonl")
+    command = [
+        sys.executable, "-m", "benchmarks.load_test", "--serve", "--port", str(args.port),
+        "--work-dir", work_dir, "--metrics-file", args.metrics_file, "--rows", str(args.rows),
+        "--append-every", str(args.append_every), "--append-rows", str(args.append_rows), "--latency", str(args.latency),
+    ]
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(
+            command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT, env=dict(os.environ, GGE_METRICS_LOG=metrics_log)
+        )
+    try:
+        _wait_healthy(args.port, server)
+        monitor = ProcessMonitor(server.pid).start()
+        url = f"ws://127.0.0.1:{args.port}/_stcore/stream"
+        results, viewers, before, driver_cpu = asyncio.run(_drive(args, url))
+        monitor.stop()
+        metrics_after = _read_metrics(args.metrics_file)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latency = _latency_table(results)
+    server_report = _server_delta(before, metrics_after)
+    server_report['stages'] = _server_stages(metrics_log, before['time'])
+    process = monitor.report()
+    errors = sum(v.errors for v in viewers)
+    timeouts = sum(r['status'] == "timeout" for r in results)
+    print_report(latency, server_report, process, driver_cpu, args, errors, timeouts)
+    print(f"log do servidor: {log_path}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                'params': {k: v for k, v in vars(args).items() if k not in ('serve', 'work_dir', 'metrics_file')},
+                'latency': latency, 'server': server_report, 'process': process,
+                'driver_cpu_pct': driver_cpu, 'errors': errors, 'timeouts': timeouts,
+            }, f, indent=2, default=str)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import pandas as pd
+
+class AggregateCube:
+    """
+    Occurrence counts pre-aggregated over the filter-bar dimensions
+    (ano × mes × unidade) plus normalized status and occurrence type.
+
+    Built once per dataset version; every KPI card, donut, bar chart and the
+    per-unit table is answered from a slice of this (small) table instead of
+    the raw rows, so filter changes cost O(distinct combinations).
+    """
+
+    FILTER_DIMS = ('ano', 'mes', 'unidade')
+
+    def __init__(self, counts, status_col=None, occ_col=None, status_labels=None):
+        self.counts = counts
+        self.status_col = status_col
+        self.occ_col = occ_col
+        # Normalized status -> spelling shown in the status donut
+        self.status_labels = status_labels or {}
+
+    @classmethod
+    def build(cls, df, status_col=None, occ_col=None):
+        """
+        Aggregates the raw frame into the cube (one pass over the rows).
+        Dimensions are the categorical columns from ``standardize_columns``,
+        so grouping works on integer codes. Status is grouped on its
+        normalized code, so the sheet's spellings of one status share a row.
+        """
+        keys = pd.DataFrame(index=df.index)
+        for dim in cls.FILTER_DIMS:
+            if dim in df.columns:
+                keys[dim] = df[dim]
+        status_labels = None
+        if status_col:
+            keys['status'] = df['status_code']
+            keys['resolvido'] = df['is_resolved']
+            status_labels = _status_labels(df['status_code'], df[status_col])
+        if occ_col:
+            keys['ocorrencia'] = df[occ_col]
+
+        if keys.columns.empty:
+            counts = pd.DataFrame({'n': [len(df)]})
+        else:
+            counts = (
+                keys.groupby(list(keys.columns), dropna=False, observed=True, sort=False)
+                .size()
+                .reset_index(name='n')
+            )
+        return cls(counts, status_col=status_col, occ_col=occ_col, status_labels=status_labels)
+
+    def slice(self, ano=None, mes=None, unidade=None):
+        """
+        Returns the cube rows matching the selected filters (None = all).
+        """
+        sl = self.counts
+        for dim, value in (('ano', ano), ('mes', mes), ('unidade', unidade)):
+            if value is not None and dim in sl.columns:
+                sl = sl[sl[dim] == value]
+        return sl
+
+    @staticmethod
+    def total(sl):
+        return int(sl['n'].sum())
+
+    @staticmethod
+    def resolved(sl):
+        if 'resolvido' not in sl.columns:
+            return None
+        return int(sl.loc[sl['resolvido'], 'n'].sum())
+
+    @staticmethod
+    def by_unit(sl):
+        """
+        Occurrences per unidade, largest first.
+        """
+        if 'unidade' not in sl.columns:
+            return pd.Series(dtype='int64')
+        return sl.groupby('unidade', observed=True)['n'].sum().sort_values(ascending=False, kind='stable')
+
+    def by_status(self, sl):
+        """
+        Occurrences per status (as most often spelled in the sheet), largest first.
+        """
+        if 'status' not in sl.columns:
+            return pd.Series(dtype='int64')
+        counts = sl.groupby('status', observed=True)['n'].sum().sort_values(ascending=False, kind='stable')
+        counts.index = pd.Index([self.status_labels.get(c, c) for c in counts.index], name='status')
+        return counts
+
+    @staticmethod
+    def by_occurrence(sl, top=None):
+        if 'ocorrencia' not in sl.columns:
+            return pd.Series(dtype='int64')
+        counts = sl.groupby('ocorrencia', observed=True)['n'].sum().sort_values(ascending=False, kind='stable')
+        return counts.head(top) if top else counts
+
+    @staticmethod
+    def unit_performance(sl):
+        """
+        Total, resolved count and resolved rate (%, numeric) per unidade.
+        """
+        perf = sl.groupby('unidade', observed=True)['n'].sum().rename('Total').to_frame()
+        if 'resolvido' in sl.columns:
+            perf['Resolvidos'] = sl[sl['resolvido']].groupby('unidade', observed=True)['n'].sum()
+            perf['Resolvidos'] = perf['Resolvidos'].fillna(0).astype(int)
+            perf['Taxa %'] = (perf['Resolvidos'] / perf['Total'] * 100).round(1)
+        return perf.reset_index()
+
+def _status_labels(codes, raw):
+    """
+    Most frequent (stripped) raw spelling of each normalized status.
+    """
+    pairs = pd.DataFrame({'code': codes, 'label': raw.astype(str).str.strip()}).value_counts()
+    first = pairs.reset_index().drop_duplicates('code')
+    return dict(zip(first['code'], first['label']))
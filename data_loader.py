@@ -1,12 +1,125 @@
+import datetime as dt
+import itertools
+import logging
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
 import gspread
+from gspread.utils import ValueRenderOption, rowcol_to_a1
+from pandas.api.types import union_categoricals
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import streamlit as st
+from instrumentation import counters, incr, record, timed, track_http_session
+from resilience import ResilientHTTPClient, SingleFlight
+from snapshot_store import save_snapshot, touch_snapshot
 
-def get_gspread_client():
+logger = logging.getLogger(__name__)
+
+# Default spreadsheet (used when secrets.toml lists no [[sources]])
+DEFAULT_SHEET_URL = "https://docs.google.com/spreadsheets/d/196o1A0zn6YdDgfENaNbMxoqWEJuc02uzZTz-4yWAJ3U/edit?usp=sharing"
+
+MONTH_ORDER = [
+    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+    "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
+]
+MONTH_NAMES_EN = {
+    'January': 'Janeiro', 'February': 'Fevereiro', 'March': 'Março',
+    'April': 'Abril', 'May': 'Maio', 'June': 'Junho',
+    'July': 'Julho', 'August': 'Agosto', 'September': 'Setembro',
+    'October': 'Outubro', 'November': 'Novembro', 'December': 'Dezembro'
+}
+RESOLVED_STATUS = 'RESOLVIDO'
+
+# Date formats tried (in order) against a sample of the 'data' column; the
+# first one that parses the whole sample is used for the vectorized parse.
+# Brazilian day-first formats come first so 03/04 is read as 3 April.
+DATE_FORMATS = [
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S',
+    '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%d-%m-%Y',
+    '%d/%m/%y %H:%M', '%d/%m/%y',
+]
+DATE_SAMPLE_SIZE = 200
+# Google Sheets serial dates count days from 1899-12-30
+SHEETS_EPOCH = '1899-12-30'
+# Cells are read as displayed in the sheet. The render option applies to the
+# whole read, and unformatted values cannot tell a time (0.4375 = 10:30), a
+# percentage or a currency from a plain number, so any other render would
+# strip the formatting of every such column in the table and the exports.
+# Only the 'data' column is parsed, from its text (see parse_dates).
+VALUE_RENDER = {
+    'value_render_option': ValueRenderOption.formatted,
+}
+# Parsed 'data' columns from the previous refresh, per source: unchanged
+# leading rows are reused and only appended rows are parsed.
+_date_memo = {}
+
+# Header spellings recognised for each standard column (case-insensitive)
+COLUMN_VARIATIONS = {
+    'ano': ['ano', 'year', 'exercício', 'exercicio', 'annee'],
+    'mes': ['mês', 'mes', 'month', 'período', 'periodo', 'mois'],
+    'unidade': ['unidade', 'campus', 'unidade escolar', 'escola', 'unidade_escolar', 'local', 'site'],
+    'data': ['data', 'date', 'timestamp', 'criado em', 'created_at', 'horário', 'horario']
+}
+# Column plans resolved per header fingerprint, and the fingerprint last seen
+# per source (to report schema drift between refreshes)
+COLUMN_PLAN_CACHE_SIZE = 64
+_column_plans = {}
+_source_schemas = {}
+# Normalized (stripped, upper-case) spellings of unidade/status labels
+LABEL_MEMO_SIZE = 10_000
+_normalized_labels = {}
+# Sources are standardized on pool threads; eviction must not race a lookup
+_labels_lock = threading.Lock()
+
+# Incremental sync: rows per checksum block and the sync state per worksheet.
+# Each delta sync re-reads the header, the last known row (anchor) and ONE
+# earlier block in rotation, and every FULL_SYNC_EVERY-th sync re-reads the
+# whole sheet. An edit to an old row therefore shows up within
+# min(ceil(rows / SYNC_BLOCK_ROWS), FULL_SYNC_EVERY) refreshes whatever the
+# sheet size: at most an hour at the refresher's 15-min max age on an idle
+# sheet, sooner when appends trigger refreshes (and on the next refresh when
+# the Drive probe sees the edit).
+SYNC_BLOCK_ROWS = 500
+FULL_SYNC_EVERY = 4
+# Upper bound on concurrent worksheet fetches when loading several sources
+MAX_PARALLEL_FETCHES = 4
+_sync_state = {}
+_sync_lock = threading.Lock()
+# Bumped whenever a synced frame actually changes, so a refresh can tell
+# that it brought back the same data
+_sync_generations = itertools.count(1)
+
+# Process-wide authorized client: one OAuth token exchange and one keep-alive
+# connection pool shared by every session, refresher and fetch thread.
+# google-auth's AuthorizedSession refreshes on its own 3m45s before expiry,
+# unlocked and per request; the larger margin makes the locked refresh here
+# happen first, so concurrent requests never each trigger an exchange.
+TOKEN_REFRESH_MARGIN = dt.timedelta(minutes=5)
+HTTP_POOL_SIZE = 16
+_client = None
+_client_lock = threading.Lock()
+# Why the last client creation failed, surfaced through the refresher's error
+_client_error = None
+# Concurrent refreshes of the same sources (refresher thread, cold-start
+# sessions) share one in-flight fetch instead of each hitting the API.
+_refresh_flight = SingleFlight()
+# Spreadsheets whose Drive metadata is not readable (API-key clients on
+# non-public files, missing Drive scope): probed with a sentinel range instead.
+_drive_probe_unavailable = set()
+
+def _create_gspread_client():
     """
     Establishes connection to Google Sheets using credentials or API Key from st.secrets.
+    Runs in background threads too, so failures are logged, not shown.
     """
+    global _client_error
     try:
         if "google_service_account" in st.secrets:
             scopes = [
@@ -15,103 +128,971 @@ def get_gspread_client():
             ]
             creds_dict = dict(st.secrets["google_service_account"])
             creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-            return gspread.authorize(creds)
+            with timed("sheets_auth", method="service_account"):
+                client = gspread.authorize(creds, http_client=ResilientHTTPClient)
         elif "google" in st.secrets and "api_key" in st.secrets["google"]:
             # Using API Key for public sheets
-            return gspread.api_key(st.secrets["google"]["api_key"])
+            with timed("sheets_auth", method="api_key"):
+                client = gspread.api_key(st.secrets["google"]["api_key"], http_client=ResilientHTTPClient)
         else:
-            st.error("Credenciais (google_service_account or api_key) não encontradas em st.secrets.")
+            _client_error = "Credenciais (google_service_account or api_key) não encontradas em st.secrets."
+            logger.error(_client_error)
             return None
+        session = getattr(client.http_client, "session", None)
+        if session is not None:
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+        _client_error = None
+        return _instrument_client(client)
     except Exception as e:
-        st.error(f"❌ Erro crítico de autenticação: {e}")
-        st.info("💡 Dica: Verifique se as permissões da conta de serviço estão corretas no Google Cloud Console.")
+        _client_error = f"Erro crítico de autenticação: {e}"
+        logger.error("%s (verifique se as permissões da conta de serviço estão corretas no Google Cloud Console)", _client_error)
         return None
 
-def load_data(spreadsheet_url):
+def _instrument_client(client):
+    track_http_session(getattr(client.http_client, "session", None))
+    return client
+
+def _refresh_token_if_expiring(client):
     """
-    Loads data from 'Página1' of the specified Google Spreadsheet.
+    Refreshes the service-account token shortly before it expires, under the
+    client lock, so concurrent fetches never race on an expired token.
     """
-    client = get_gspread_client()
+    creds = getattr(client.http_client, "auth", None)
+    if not isinstance(creds, Credentials):
+        # API-key clients have no token to refresh
+        return
+    expiry = creds.expiry
+    # google-auth stores expiry as a naive UTC datetime
+    now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+    if expiry is None or expiry - now < TOKEN_REFRESH_MARGIN:
+        # The token exchange goes through a plain (unauthorized) transport: the
+        # AuthorizedSession would try to attach and refresh the same credentials
+        session = client.http_client.session
+        auth_request = getattr(session, "_auth_request", None) or Request()
+        with timed("sheets_token_refresh"):
+            creds.refresh(auth_request)
+
+def get_gspread_client():
+    """
+    Returns the process-wide authorized client, creating it on first use.
+    Safe to call from any session or thread; failures are not cached.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_gspread_client()
+        else:
+            incr("client_reuse")
+        if _client is not None:
+            try:
+                _refresh_token_if_expiring(_client)
+            except Exception as e:
+                logger.warning("Falha ao renovar token do Google, recriando cliente: %s", e)
+                _client = _create_gspread_client()
+        return _client
+
+def reset_gspread_client(client=None):
+    """
+    Drops the cached client (e.g. after credentials were rotated), or installs
+    the given one (e.g. a client talking to a local fake endpoint).
+    """
+    global _client
+    with _client_lock:
+        _client = _instrument_client(client) if client is not None else None
+
+def open_worksheet(client, spreadsheet_url, worksheet_title=None):
+    """
+    Opens the given worksheet, or 'Página1' falling back to the first worksheet.
+    """
+    sh = client.open_by_url(spreadsheet_url)
+    if worksheet_title:
+        return sh.worksheet(worksheet_title)
+
+    # Try to find 'Página1' first, else fallback to the first worksheet
+    try:
+        return sh.worksheet("Página1")
+    except gspread.exceptions.WorksheetNotFound:
+        worksheets = sh.worksheets()
+        if worksheets:
+            worksheet = worksheets[0]
+            logger.info("Aba 'Página1' não encontrada em %s. Usando a primeira aba: '%s'", spreadsheet_url, worksheet.title)
+            return worksheet
+        logger.error("Nenhuma aba encontrada na planilha %s", spreadsheet_url)
+        return None
+
+def load_data(spreadsheet_url, incremental=False, worksheet_title=None, client=None, raise_errors=False):
+    """
+    Loads data from 'Página1' (or ``worksheet_title``) of the specified Google Spreadsheet.
+
+    With ``incremental=True`` only rows appended (or edited) since the previous
+    call are fetched and merged into the frame kept in memory for this sheet.
+    An already authorized ``client`` can be passed to share it across fetches.
+    With ``raise_errors=True`` API errors (after retries) propagate instead of
+    being logged, so background callers can keep serving stale data.
+    """
+    client = client or get_gspread_client()
     if not client:
         return pd.DataFrame()
         
     try:
-        sh = client.open_by_url(spreadsheet_url)
-        
-        # Try to find 'Página1' first, else fallback to the first worksheet
-        try:
-            worksheet = sh.worksheet("Página1")
-        except gspread.exceptions.WorksheetNotFound:
-            worksheets = sh.worksheets()
-            if worksheets:
-                worksheet = worksheets[0]
-                st.info(f"💡 Aba 'Página1' não encontrada. Usando a primeira aba: '{worksheet.title}'")
-            else:
-                st.error("Nenhuma aba encontrada na planilha.")
-                return pd.DataFrame()
+        worksheet = open_worksheet(client, spreadsheet_url, worksheet_title)
+        if worksheet is None:
+            return pd.DataFrame()
 
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
+        bytes_before = counters().get("sheets_bytes", 0)
+        with timed("sheets_fetch", mode="incremental" if incremental else "full", worksheet=worksheet.title) as m:
+            if incremental:
+                df = sync_worksheet(spreadsheet_url, worksheet)
+            else:
+                df = _values_to_frame(worksheet.get(pad_values=False, **VALUE_RENDER))
+            m["rows"] = len(df)
+            m["bytes"] = counters().get("sheets_bytes", 0) - bytes_before
+        df.attrs['worksheet'] = worksheet.title
         return df
     except Exception as e:
-        st.error(f"❌ Erro ao acessar a planilha: {e}")
-        st.info("💡 Dica: Verifique se a URL da planilha está correta e se o acesso foi compartilhado com o e-mail da conta de serviço.")
+        if raise_errors:
+            raise
+        logger.error(
+            "Erro ao acessar a planilha %s: %s (verifique se a URL está correta e se o acesso foi "
+            "compartilhado com o e-mail da conta de serviço)", spreadsheet_url, e
+        )
+        return pd.DataFrame()
+
+def _rows_crc(rows, width, crc=0, n_rows=None):
+    """
+    Running CRC32 of rows as if padded to ``width`` cells (and to ``n_rows``
+    rows, for ranges whose trailing empty rows the API omitted), without
+    building the padded copy. Extendable on append through ``crc``.
+    """
+    missing = max(0, (n_rows or 0) - len(rows))
+    for row in itertools.chain(rows, itertools.repeat((), missing)):
+        cells = itertools.chain(map(str, row[:width]), itertools.repeat("", width - len(row)))
+        crc = zlib.crc32(("\x1f".join(cells) + "\x1e").encode("utf-8"), crc)
+    return crc
+
+def unique_headers(header):
+    """
+    Column names from the header row: stripped, blank ones named after their
+    sheet column ('coluna_3') and repeated ones suffixed ('Status_2').
+    """
+    names = []
+    used = set()
+    for i, value in enumerate(header):
+        base = name = str(value).strip() or f"coluna_{i + 1}"
+        k = 1
+        while name in used:
+            k += 1
+            name = f"{base}_{k}"
+        used.add(name)
+        names.append(name)
+    return names
+
+def _rows_to_frame(header, rows, n_rows=None):
+    """
+    Builds the frame column by column straight from the API's value rows
+    (ragged: trailing empty cells are omitted), with no per-row dicts or
+    padded row copies. Missing cells, and missing trailing rows up to
+    ``n_rows``, are empty strings as in the sheet.
+    """
+    names = unique_headers(header)
+    n = len(rows) if n_rows is None else n_rows
+    columns = list(itertools.islice(itertools.zip_longest(*rows, fillvalue=""), len(names)))
+    data = {}
+    for i, name in enumerate(names):
+        values = np.full(n, "", dtype=object)
+        if i < len(columns):
+            values[:len(rows)] = columns[i]
+            columns[i] = None  # release the transposed tuple early
+        data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+def _values_to_frame(values):
+    """
+    Frame from a whole-sheet values array (header row first), read with
+    VALUE_RENDER: every cell is its displayed text, so no column loses its
+    number, date, time, currency or percent formatting. Only 'data' is
+    parsed later, into the added 'data_dt'.
+    """
+    if not values or not values[0]:
+        return pd.DataFrame()
+    return _rows_to_frame(values[0], values[1:])
+
+def _block_range(block, n_rows, last_col):
+    """
+    A1 range of a checksum block (data row 0 is sheet row 2).
+    """
+    start = block * SYNC_BLOCK_ROWS
+    end = min(start + SYNC_BLOCK_ROWS, n_rows)
+    return start, end, f"A{start + 2}:{last_col}{end + 1}"
+
+def _full_sync(key, worksheet):
+    """
+    Reads the whole worksheet once and seeds the incremental sync state. A
+    re-read that finds the same content keeps the previous frame and
+    generation, so a scheduled full sync alone never reads as a change.
+    """
+    incr("sync_full")
+    values = worksheet.get(pad_values=False, **VALUE_RENDER)
+    if not values or not values[0]:
+        with _sync_lock:
+            _sync_state.pop(key, None)
         return pd.DataFrame()
 
-def standardize_columns(df):
+    header = list(values[0])
+    width = len(header)
+    rows = values[1:]
+    blocks = [_rows_crc(rows[i:i + SYNC_BLOCK_ROWS], width) for i in range(0, len(rows), SYNC_BLOCK_ROWS)]
+    with _sync_lock:
+        previous = _sync_state.get(key)
+    if previous is not None and (previous['header'], previous['n_rows'], previous['blocks']) == (header, len(rows), blocks):
+        df, generation = previous['df'], previous['generation']
+    else:
+        df, generation = _rows_to_frame(header, rows), next(_sync_generations)
+    with _sync_lock:
+        _sync_state[key] = {
+            'header': header,
+            'n_rows': len(rows),
+            'last_row_crc': _rows_crc(rows[-1:], width),
+            'blocks': blocks,
+            'next_block': 0,
+            'syncs_since_full': 0,
+            'appended': None,
+            'df': df,
+            'generation': generation,
+        }
+    return df
+
+def sync_worksheet(spreadsheet_url, worksheet):
+    """
+    Incrementally syncs a worksheet against the frame from the previous call.
+
+    A single ``batch_get`` reads the header row, one earlier block (rotating)
+    and everything from the last known row onwards. New rows are appended,
+    a block whose checksum changed is replaced in place, and any structural
+    change (header edited, rows inserted/deleted above the tail) falls back
+    to a full read, as does every FULL_SYNC_EVERY-th sync.
+    """
+    key = (spreadsheet_url, worksheet.title)
+    with _sync_lock:
+        state = _sync_state.get(key)
+    if state is None or state['n_rows'] == 0:
+        return _full_sync(key, worksheet)
+    if state['syncs_since_full'] + 1 >= FULL_SYNC_EVERY:
+        incr("sync_full_scheduled")
+        return _full_sync(key, worksheet)
+
+    header, n_rows = state['header'], state['n_rows']
+    width = len(header)
+    last_col = re.sub(r"\d+", "", rowcol_to_a1(1, width))
+    block = state['next_block'] % len(state['blocks'])
+    b_start, b_end, b_range = _block_range(block, n_rows, last_col)
+
+    incr("sync_delta")
+    header_vr, block_vr, tail_vr = worksheet.batch_get(
+        ["1:1", b_range, f"A{n_rows + 1}:{last_col}"], **VALUE_RENDER
+    )
+
+    # Header changed (column added/renamed) -> mapping may differ, re-read all
+    fetched_header = list(header_vr[0]) if header_vr else []
+    if fetched_header != header[:len(fetched_header)] or any(header[len(fetched_header):]):
+        return _full_sync(key, worksheet)
+
+    # The last known row must still be where we left it
+    tail = list(tail_vr)
+    if not tail or _rows_crc(tail[:1], width) != state['last_row_crc']:
+        return _full_sync(key, worksheet)
+    new_rows = tail[1:]
+
+    df = state['df']
+    blocks = list(state['blocks'])
+
+    # Rotating checksum of an earlier block catches in-place edits
+    block_rows = list(block_vr)
+    block_crc = _rows_crc(block_rows, width, n_rows=b_end - b_start)
+    if block_crc != blocks[block]:
+        df = pd.concat(
+            [df.iloc[:b_start], _rows_to_frame(header, block_rows, n_rows=b_end - b_start), df.iloc[b_end:]],
+            ignore_index=True
+        )
+        blocks[block] = block_crc
+
+    incr("sync_new_rows", len(new_rows))
+    if new_rows:
+        df = pd.concat([df, _rows_to_frame(header, new_rows)], ignore_index=True)
+        # Extend the running checksum of the (possibly partial) last block
+        fill = SYNC_BLOCK_ROWS - (n_rows % SYNC_BLOCK_ROWS or SYNC_BLOCK_ROWS)
+        if fill:
+            blocks[-1] = _rows_crc(new_rows[:fill], width, blocks[-1])
+        rest = new_rows[fill:]
+        blocks += [_rows_crc(rest[i:i + SYNC_BLOCK_ROWS], width) for i in range(0, len(rest), SYNC_BLOCK_ROWS)]
+
+    with _sync_lock:
+        _sync_state[key] = {
+            'header': header,
+            'n_rows': n_rows + len(new_rows),
+            'last_row_crc': _rows_crc(tail[-1:], width),
+            'blocks': blocks,
+            'next_block': block + 1,
+            'syncs_since_full': state['syncs_since_full'] + 1,
+            'appended': len(new_rows),
+            'df': df,
+            'generation': state['generation'] if df is state['df'] else next(_sync_generations),
+        }
+    return df
+
+def schema_fingerprint(columns):
+    """
+    Short stable hash of a header row (names and order).
+    """
+    return f"{zlib.crc32(chr(31).join(map(str, columns)).encode('utf-8')):08x}"
+
+@dataclass(frozen=True)
+class ColumnPlan:
+    """
+    Everything standardize_columns needs to know about a header row,
+    resolved once per fingerprint: the renames onto the standard names, the
+    occurrence/status columns (standard names) and which of ano/mes are
+    derived from the 'data' column.
+    """
+    fingerprint: str
+    columns: tuple
+    renames: dict
+    occ_col: object
+    status_col: object
+    has_date: bool
+    derive_ano: bool
+    derive_mes: bool
+
+    @property
+    def output_columns(self):
+        return [self.renames.get(c, c) for c in self.columns]
+
+def _resolve_column_plan(columns, fingerprint):
+    renames = {}
+    for target, variations in COLUMN_VARIATIONS.items():
+        for col in columns:
+            if str(col).lower() in variations:
+                # A sheet already using the standard name elsewhere keeps its own column
+                if target not in columns or col == target:
+                    renames[col] = target
+                break
+    output = [renames.get(c, c) for c in columns]
+    has_date = 'data' in output
+    return ColumnPlan(
+        fingerprint=fingerprint,
+        columns=columns,
+        renames={c: t for c, t in renames.items() if c != t},
+        occ_col=find_occurrence_column(output),
+        status_col=find_status_column(output),
+        has_date=has_date,
+        derive_ano=has_date and 'ano' not in output,
+        derive_mes=has_date and 'mes' not in output,
+    )
+
+def column_plan(columns):
+    """
+    The ColumnPlan of a header row, memoized per fingerprint: refreshes with
+    an unchanged header skip column detection entirely.
+    """
+    columns = tuple(columns)
+    fingerprint = schema_fingerprint(columns)
+    plan = _column_plans.get(fingerprint)
+    if plan is None or plan.columns != columns:
+        incr("column_plan_miss")
+        plan = _resolve_column_plan(columns, fingerprint)
+        _column_plans[fingerprint] = plan
+        while len(_column_plans) > COLUMN_PLAN_CACHE_SIZE:
+            _column_plans.pop(next(iter(_column_plans)))
+    return plan
+
+def _check_schema(plan, cache_key):
+    """
+    Reports a header change between refreshes of the same source (columns
+    added, removed or renamed in the sheet) instead of letting it surface
+    later as missing filters or KPIs.
+    """
+    previous = _source_schemas.get(cache_key)
+    _source_schemas[cache_key] = plan
+    if previous is None or previous.fingerprint == plan.fingerprint:
+        return
+    incr("schema_drift")
+    added = [c for c in plan.columns if c not in previous.columns]
+    removed = [c for c in previous.columns if c not in plan.columns]
+    lost = [
+        role for role, before, now in (
+            ('data', previous.has_date, plan.has_date),
+            ('ocorrência', previous.occ_col, plan.occ_col),
+            ('status', previous.status_col, plan.status_col),
+        ) if before and not now
+    ] + [t for t in ('ano', 'mes', 'unidade') if t in previous.output_columns and t not in plan.output_columns]
+    record("schema_drift", source=str(cache_key), added=added, removed=removed, lost=lost)
+    log = logger.warning if lost else logger.info
+    log("Cabeçalho de %s mudou (adicionadas: %s; removidas: %s; papéis perdidos: %s)",
+        cache_key, added or "-", removed or "-", lost or "-")
+    # The parsed-dates memo belongs to the old layout
+    _date_memo.pop(cache_key, None)
+
+def _normalize_labels(labels):
+    """
+    Stripped, upper-case labels, memoized across refreshes (the same few
+    unidade/status spellings arrive every time).
+    """
+    distinct = list(dict.fromkeys(labels))
+    with _labels_lock:
+        missing = [label for label in distinct if label not in _normalized_labels]
+        if missing:
+            if len(_normalized_labels) + len(missing) > LABEL_MEMO_SIZE:
+                # Eviction also drops this call's already-known labels
+                _normalized_labels.clear()
+                missing = distinct
+            _normalized_labels.update(zip(missing, pd.Index(missing, dtype=object).str.strip().str.upper()))
+        normalized = [_normalized_labels[label] for label in labels]
+    return pd.Index(normalized, dtype=object)
+
+def find_occurrence_column(columns):
+    return next((c for c in columns if 'OCORR' in str(c).upper()), None)
+
+def find_status_column(columns):
+    return next((c for c in columns if 'STATUS' in str(c).upper()), None)
+
+def _to_category(series, normalize=None, categories=None):
+    """
+    Dictionary-encodes a column as strings. ``normalize`` is applied to the
+    distinct values only (not per row); values that collapse onto the same
+    normalized string share one code. ``categories`` fixes a leading order
+    (e.g. months) and makes the result ordered.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    labels = pd.Index(uniques).astype(str)
+    if normalize is not None:
+        labels = normalize(labels)
+    label_codes, distinct = pd.factorize(labels)
+    if categories is None:
+        order = pd.Index(sorted(distinct))
+        ordered = False
+    else:
+        order = pd.Index(list(categories) + sorted(set(distinct) - set(categories)))
+        ordered = True
+    remap = order.get_indexer(distinct)[label_codes]
+    return pd.Series(
+        pd.Categorical.from_codes(remap[codes], categories=order, ordered=ordered),
+        index=series.index,
+        name=series.name,
+    )
+
+def detect_date_format(values):
+    """
+    Picks the first entry of DATE_FORMATS that parses every sampled string,
+    or None when the sample matches no single format.
+    """
+    sample = pd.Series(values[:DATE_SAMPLE_SIZE], dtype=object).str.strip()
+    sample = sample[sample != ""]
+    if sample.empty:
+        return None
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all():
+            return fmt
+    return None
+
+# Width of each strptime directive when zero-padded (fixed-width fast path)
+_DIRECTIVE_WIDTHS = {'d': 2, 'm': 2, 'Y': 4, 'y': 2, 'H': 2, 'M': 2, 'S': 2}
+_DIRECTIVE_FIELDS = {'d': 'day', 'm': 'month', 'Y': 'year', 'y': 'year', 'H': 'hour', 'M': 'minute', 'S': 'second'}
+
+def _fixed_width_strptime(text, fmt):
+    """
+    Parses strings that all have the zero-padded width implied by ``fmt`` by
+    slicing digit columns out of a numpy unicode array (no per-row Python).
+    Returns None when the strings are not uniformly fixed-width.
+    """
+    fields, literals, pos = {}, [], 0
+    i = 0
+    while i < len(fmt):
+        if fmt[i] == '%' and i + 1 < len(fmt):
+            directive = fmt[i + 1]
+            if directive not in _DIRECTIVE_WIDTHS:
+                return None
+            fields[directive] = (pos, pos + _DIRECTIVE_WIDTHS[directive])
+            pos += _DIRECTIVE_WIDTHS[directive]
+            i += 2
+        else:
+            literals.append((pos, fmt[i]))
+            pos += 1
+            i += 1
+
+    # Lengths are checked before the cast: U{pos} would silently truncate
+    # longer strings (e.g. a time after the date) into valid-looking ones
+    lengths = pd.Series(text, dtype=object, copy=False).str.len()
+    if len(lengths) == 0 or (lengths != pos).any():
+        return None
+    arr = np.asarray(text, dtype=f'U{pos}')
+    chars = arr.view('U1').reshape(len(arr), pos)
+    for at, literal in literals:
+        if (chars[:, at] != literal).any():
+            return None
+    digits = chars.view(np.uint32).astype(np.int64) - ord('0')
+
+    parts = {}
+    for directive, (start, end) in fields.items():
+        block = digits[:, start:end]
+        if ((block < 0) | (block > 9)).any():
+            return None
+        parts[_DIRECTIVE_FIELDS[directive]] = block @ (10 ** np.arange(end - start - 1, -1, -1))
+    if 'y' in fields:
+        parts['year'] = parts['year'] + np.where(parts['year'] < 69, 2000, 1900)
+    return pd.to_datetime(pd.DataFrame(parts), errors='coerce').to_numpy()
+
+def _parse_text_dates(text, fmt):
+    """
+    Parses distinct strings only, with the fixed-width path when possible.
+    """
+    codes, uniques = pd.factorize(text)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = _fixed_width_strptime(uniques.to_numpy(), fmt) if fmt is not None else None
+    if parsed is None:
+        if fmt is not None:
+            parsed = pd.to_datetime(uniques, format=fmt, errors='coerce').to_numpy()
+        else:
+            parsed = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[ns]')
+        stray = pd.isna(parsed) & (uniques.str.strip() != "").to_numpy()
+        if stray.any():
+            parsed[stray] = pd.to_datetime(uniques[stray].str.strip(), format='mixed', dayfirst=True, errors='coerce').to_numpy()
+    result = parsed.astype('datetime64[ns]')[codes]
+    result[codes == -1] = np.datetime64('NaT')
+    return result
+
+def _serial_dates(serials):
+    """
+    Google Sheets serial day numbers as datetimes. Serials are floats, so
+    the binary error is rounded off (Sheets keeps milliseconds).
+    """
+    serials = np.asarray(serials, dtype=float)
+    # Out of the datetime64[ns] range (years ~1735-2173 kept) -> NaT, like errors='coerce'
+    valid = (serials > -60_000) & (serials < 100_000)
+    millis = serials * 86_400_000
+    dates = np.full(len(millis), np.datetime64('NaT'), dtype='datetime64[ns]')
+    offsets = np.rint(millis[valid]).astype('int64').astype('timedelta64[ms]')
+    dates[valid] = np.datetime64(SHEETS_EPOCH, 'ms') + offsets
+    return dates
+
+def _parse_date_values(values, fmt):
+    """
+    Vectorized parse of raw sheet values: numbers are Google Sheets serial
+    dates, strings use the detected format (day-first fallback for strays).
+    """
+    if values.dtype.kind in 'iuf':
+        # An all-serial column (e.g. dates typed as numbers): no per-cell type checks at all
+        return _serial_dates(values)
+    raw = pd.Series(values, dtype=object)
+    kind = pd.api.types.infer_dtype(raw, skipna=True)
+    if kind in ('string', 'empty'):
+        is_number = np.zeros(len(raw), dtype=bool)
+        is_text = raw.notna().to_numpy()
+    else:
+        types = raw.map(type)
+        is_number = types.isin([int, float]).to_numpy()
+        is_text = types.eq(str).to_numpy()
+
+    parsed = np.full(len(raw), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if is_number.any():
+        parsed[is_number] = _serial_dates(raw[is_number].to_numpy())
+    if is_text.any():
+        parsed[is_text] = _parse_text_dates(raw[is_text].to_numpy(), fmt)
+    return parsed
+
+def parse_dates(series, cache_key=None):
+    """
+    Parses the sheet's date column once per row: the format is detected once
+    per source and, with a ``cache_key``, rows identical to the previous call's
+    leading rows reuse their parsed value (the sheet only grows at the tail).
+    """
+    # An all-serial column stays numeric (no boxing into Python objects)
+    raw = series.to_numpy() if pd.api.types.is_numeric_dtype(series) else series.to_numpy(dtype=object)
+    memo = _date_memo.get(cache_key) if cache_key is not None else None
+
+    reused = 0
+    if memo is not None and len(raw) >= len(memo['raw']) and np.array_equal(raw[:len(memo['raw'])], memo['raw']):
+        reused = len(memo['raw'])
+    fmt = memo['fmt'] if memo is not None and memo['fmt'] is not None else None
+    tail = raw[reused:]
+    if fmt is None and raw.dtype == object:
+        text = [v for v in tail if isinstance(v, str)]
+        fmt = detect_date_format(text)
+
+    parsed_tail = _parse_date_values(tail, fmt)
+    parsed = np.concatenate([memo['parsed'][:reused], parsed_tail]) if reused else parsed_tail
+    if cache_key is not None:
+        _date_memo[cache_key] = {'raw': raw, 'parsed': parsed, 'fmt': fmt}
+    return pd.Series(parsed, index=series.index, name='data_dt')
+
+def _years_from_dates(dates):
+    """
+    Categorical year labels ('2024') from a datetime column via integer codes.
+    """
+    years = dates.dt.year
+    valid = years.notna().to_numpy()
+    codes, uniques = pd.factorize(years[valid].astype(int), sort=True)
+    all_codes = np.full(len(dates), -1, dtype=np.int64)
+    all_codes[valid] = codes
+    return pd.Series(
+        pd.Categorical.from_codes(all_codes, categories=[str(y) for y in uniques]),
+        index=dates.index,
+    )
+
+def _months_from_dates(dates):
+    """
+    Portuguese month names from a datetime column through a code lookup table.
+    """
+    codes = dates.dt.month.fillna(0).astype(int).to_numpy() - 1
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=MONTH_ORDER, ordered=True),
+        index=dates.index,
+    )
+
+def _pt_month_names(labels):
+    return pd.Index([MONTH_NAMES_EN.get(m, m) for m in labels])
+
+def _derive_dates(columns, plan, cache_key):
+    """
+    Adds data_dt (and ano/mes when the sheet has no such columns) to the
+    column dict. A 'data' column that cannot be parsed is reported and the
+    date-derived filters are left out, rather than failing the refresh.
+    """
+    raw = columns['data']
+    try:
+        parsed = parse_dates(raw, cache_key=cache_key)
+    except (TypeError, ValueError, OverflowError) as e:
+        incr("date_parse_failed")
+        logger.warning("Coluna de data de %s não pôde ser interpretada (%s); filtros de ano/mês derivados omitidos", cache_key, e)
+        return
+    if parsed.isna().all() and raw.notna().any():
+        incr("date_parse_empty")
+        logger.warning("Nenhuma data reconhecida na coluna de data de %s", cache_key)
+    columns['data_dt'] = parsed
+    if plan.derive_ano:
+        columns['ano'] = _years_from_dates(parsed)
+    if plan.derive_mes:
+        columns['mes'] = _months_from_dates(parsed)
+
+def standardize_columns(df, cache_key=None):
     """
     Robustly detects and standardizes columns for Year, Month, and Unit.
+    Detection runs once per distinct header (see column_plan); the frame is
+    then assembled in one pass from the plan.
     """
     if df.empty:
         return df
 
-    # Standard mapping (case-insensitive)
-    mapping = {
-        'ano': ['ano', 'year', 'exercício', 'exercicio', 'annee'],
-        'mes': ['mês', 'mes', 'month', 'período', 'periodo', 'mois'],
-        'unidade': ['unidade', 'campus', 'unidade escolar', 'escola', 'unidade_escolar', 'local', 'site'],
-        'data': ['data', 'date', 'timestamp', 'criado em', 'created_at', 'horário', 'horario']
-    }
-    
-    new_cols = {}
-    current_cols = [c.lower() for c in df.columns]
-    
-    # 1. Direct mapping
-    for target, variations in mapping.items():
-        for col in df.columns:
-            if col.lower() in variations:
-                new_cols[col] = target
-                break
-                
-    df_mapped = df.rename(columns=new_cols)
-    
-    # 2. Derive from 'data' if 'ano' or 'mes' missing
-    if 'data' in df_mapped.columns:
-        try:
-            df_mapped['data_dt'] = pd.to_datetime(df_mapped['data'], errors='coerce')
-            if 'ano' not in df_mapped.columns:
-                df_mapped['ano'] = df_mapped['data_dt'].dt.year.astype(str)
-            if 'mes' not in df_mapped.columns:
-                df_mapped['mes'] = df_mapped['data_dt'].dt.month_name()
-            
-            # Map month names to Portuguese
-            month_map = {
-                'January': 'Janeiro', 'February': 'Fevereiro', 'March': 'Março',
-                'April': 'Abril', 'May': 'Maio', 'June': 'Junho',
-                'July': 'Julho', 'August': 'Agosto', 'September': 'Setembro',
-                'October': 'Outubro', 'November': 'Novembro', 'December': 'Dezembro'
-            }
-            if 'mes' in df_mapped.columns:
-                df_mapped['mes'] = df_mapped['mes'].replace(month_map)
-        except:
-            pass
-            
-    # Normalize values for filters
-    if 'ano' in df_mapped.columns:
-        df_mapped['ano'] = df_mapped['ano'].astype(str)
-    if 'mes' in df_mapped.columns:
-        df_mapped['mes'] = df_mapped['mes'].astype(str)
-    if 'unidade' in df_mapped.columns:
-        df_mapped['unidade'] = df_mapped['unidade'].astype(str).str.strip().str.upper()
-        
+    plan = column_plan(df.columns)
+    if cache_key is not None:
+        _check_schema(plan, cache_key)
+
+    columns = dict(zip(plan.output_columns, (df.iloc[:, i] for i in range(df.shape[1]))))
+
+    # 1. Derive from 'data' if 'ano' or 'mes' missing
+    if plan.has_date:
+        _derive_dates(columns, plan, cache_key)
+
+    # 2. Normalize values for filters as dictionary-encoded (categorical) columns
+    if 'ano' in columns and not isinstance(columns['ano'].dtype, pd.CategoricalDtype):
+        columns['ano'] = _to_category(columns['ano'])
+    if 'mes' in columns and not isinstance(columns['mes'].dtype, pd.CategoricalDtype):
+        # Sheet-provided month column: English names are mapped to Portuguese
+        columns['mes'] = _to_category(columns['mes'], normalize=_pt_month_names, categories=MONTH_ORDER)
+    if 'unidade' in columns:
+        columns['unidade'] = _to_category(columns['unidade'], normalize=_normalize_labels)
+    if plan.occ_col:
+        columns[plan.occ_col] = _to_category(columns[plan.occ_col])
+    if plan.status_col:
+        columns[plan.status_col] = _to_category(columns[plan.status_col])
+        columns['status_code'] = _to_category(columns[plan.status_col], normalize=_normalize_labels)
+        columns['is_resolved'] = (columns['status_code'] == RESOLVED_STATUS).to_numpy()
+
+    df_mapped = pd.DataFrame(columns, index=df.index, copy=False)
+    df_mapped.attrs = dict(df.attrs)
     return df_mapped
+
+def configured_sources(default_url):
+    """
+    Sources listed in secrets.toml as [[sources]] tables (url, optional
+    worksheet and label), or just the default spreadsheet.
+    """
+    try:
+        if "sources" in st.secrets:
+            return normalize_sources([dict(src) for src in st.secrets["sources"]])
+    except FileNotFoundError:
+        pass
+    return normalize_sources([default_url])
+
+def normalize_sources(sources):
+    """
+    Accepts URLs or dicts ({'url', 'worksheet', 'label'}) and returns dicts.
+    """
+    normalized = []
+    for src in sources:
+        if isinstance(src, str):
+            src = {'url': src}
+        normalized.append({
+            'url': src['url'],
+            'worksheet': src.get('worksheet'),
+            'label': src.get('label'),
+        })
+    return normalized
+
+def sources_key(sources):
+    """
+    Stable identifier of a list of sources (used for snapshots).
+    """
+    sources = normalize_sources(sources)
+    if len(sources) == 1 and not sources[0]['worksheet']:
+        return sources[0]['url']
+    return "|".join(f"{s['url']}#{s['worksheet'] or ''}" for s in sources)
+
+def _fetch_source(source, client):
+    """
+    Fetches (incrementally) one source.
+    """
+    return load_data(source['url'], incremental=True, worksheet_title=source['worksheet'], client=client, raise_errors=True)
+
+def _standardize_source(source, raw_df):
+    """
+    Standardizes one fetched source, labelled for the union.
+    """
+    with timed("standardize", rows=len(raw_df), worksheet=raw_df.attrs.get('worksheet')):
+        df = standardize_columns(raw_df, cache_key=(source['url'], source['worksheet']))
+    return source['label'] or raw_df.attrs.get('worksheet') or source['url'], df
+
+def _map_sources(fn, items, max_workers):
+    """
+    ``fn`` over per-source items, concurrently when there are several.
+    """
+    if len(items) == 1:
+        return [fn(items[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="gge-fetch") as pool:
+        return list(pool.map(fn, items))
+
+def union_standardized(frames):
+    """
+    Unions per-source standardized frames into one dataset with a 'fonte'
+    column. Occurrence/status columns are aligned on the first source's names
+    and categorical columns are merged with union_categoricals, so the result
+    keeps the compact dictionary encoding.
+    """
+    canonical = {}
+    aligned = []
+    seen_labels = set()
+    for label, df in frames:
+        renames = {}
+        for finder in (find_occurrence_column, find_status_column):
+            col = finder(df.columns)
+            if col is not None:
+                canonical.setdefault(finder, col)
+                if col != canonical[finder]:
+                    renames[col] = canonical[finder]
+        while label in seen_labels:
+            label = f"{label} ({len(seen_labels) + 1})"
+        seen_labels.add(label)
+        df = df.rename(columns=renames).assign(
+            fonte=pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int64), categories=[label])
+        )
+        aligned.append(df)
+
+    if len(aligned) == 1:
+        return aligned[0]
+
+    columns = list(dict.fromkeys(c for df in aligned for c in df.columns))
+    cat_cols = [
+        c for c in columns
+        if any(c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype) for df in aligned)
+    ]
+    combined = pd.concat([df.drop(columns=[c for c in cat_cols if c in df.columns]) for df in aligned], ignore_index=True)
+    for c in cat_cols:
+        parts = []
+        for df in aligned:
+            if c in df.columns:
+                parts.append(df[c].astype('category'))
+            else:
+                parts.append(pd.Categorical.from_codes(np.full(len(df), -1), categories=pd.Index([], dtype=object)))
+        combined[c] = union_categoricals(parts, sort_categories=True, ignore_order=True)
+    # Derived flags of a source without the column (e.g. no status column) are
+    # False: a concat would leave NaN in an object column
+    for c in columns:
+        if c not in cat_cols and any(c in df.columns and pd.api.types.is_bool_dtype(df[c]) for df in aligned):
+            combined[c] = combined[c].eq(True).to_numpy()
+    if 'mes' in combined.columns:
+        extras = [m for m in combined['mes'].cat.categories if m not in MONTH_ORDER]
+        combined['mes'] = combined['mes'].cat.set_categories(MONTH_ORDER + extras, ordered=True)
+    return combined[columns]
+
+def load_sources(sources, max_workers=MAX_PARALLEL_FETCHES, generation=None):
+    """
+    Fetches every source concurrently with one shared authorized client,
+    standardizes each and unions them. Total latency tracks the slowest
+    single fetch instead of the sum. Raises if any source fails, so a
+    partial union is never published. Given the ``generation`` (see
+    sync_generation) of the data the caller already has, returns None
+    without standardizing anything when the sync brought back the same frames.
+    """
+    sources = normalize_sources(sources)
+    client = get_gspread_client()
+    if not client:
+        raise RuntimeError(_client_error or "Credenciais do Google indisponíveis")
+
+    with timed("sheets_fetch_all", sources=len(sources)):
+        raw_frames = _map_sources(lambda src: _fetch_source(src, client), sources, max_workers)
+    if generation is not None and sync_generation(sources) == generation:
+        incr("sync_unchanged")
+        return None
+    results = _map_sources(lambda item: _standardize_source(*item), list(zip(sources, raw_frames)), max_workers)
+
+    frames = [(label, df) for label, df in results if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return union_standardized(frames)
+
+def _synced_state(source):
+    """
+    (worksheet title, sync state) of a source, None before its first sync.
+    """
+    with _sync_lock:
+        matches = [
+            (key[1], state) for key, state in _sync_state.items()
+            if key[0] == source['url'] and source['worksheet'] in (None, key[1])
+        ]
+    return matches[0] if matches else None
+
+def _sentinel_revision(source, client):
+    """
+    Fallback probe: CRC of the last synced row and the row after it. Catches
+    appends and edits to the tail; older edits are left to the delta sync's
+    rotating block checksums on the next full refresh.
+    """
+    synced = _synced_state(source)
+    if synced is None:
+        return None
+    title, state = synced
+    n_rows, width = state['n_rows'], len(state['header'])
+    last_col = re.sub(r"\d+", "", rowcol_to_a1(1, width))
+    sentinel = f"'{title}'!A{n_rows + 1}:{last_col}{n_rows + 2}"
+    # Rendered like the sync reads it, so the token can be compared with the synced rows
+    params = {'valueRenderOption': VALUE_RENDER['value_render_option']}
+    response = client.http_client.values_get(gspread.utils.extract_id_from_url(source['url']), sentinel, params=params)
+    return f"{n_rows}:{_rows_crc(response.get('values', []), width)}"
+
+def synced_revision(sources, revision):
+    """
+    The change token of the data just synced. A sentinel token probed before
+    the sync still points at the old last row (so an append would look like
+    a second change), and is recomputed from the new sync state without a
+    request: the synced last row followed by nothing (also when the probe
+    ran before the first sync and returned None). Drive tokens are kept.
+    """
+    sources = normalize_sources(sources)
+    tokens = revision.split("|") if revision is not None else [None] * len(sources)
+    if len(tokens) != len(sources):
+        return None
+    for i, source in enumerate(sources):
+        if gspread.utils.extract_id_from_url(source['url']) in _drive_probe_unavailable:
+            synced = _synced_state(source)
+            state = synced[1] if synced is not None else None
+            tokens[i] = f"{state['n_rows']}:{state['last_row_crc']}" if state is not None else None
+    return None if None in tokens else "|".join(tokens)
+
+def unexplained_changes(sources, revision, previous):
+    """
+    Sources whose change token moved from ``previous`` to ``revision`` although
+    their last sync was a delta that appended nothing: an edit somewhere in
+    the sheet, which the one block the delta sync checked may not cover.
+    """
+    if revision is None or previous is None:
+        return []
+    sources = normalize_sources(sources)
+    tokens, old_tokens = revision.split("|"), previous.split("|")
+    if len(tokens) != len(sources) or len(old_tokens) != len(sources):
+        return []
+    unexplained = []
+    for source, token, old_token in zip(sources, tokens, old_tokens):
+        synced = _synced_state(source)
+        if token != old_token and synced is not None and synced[1]['appended'] == 0:
+            unexplained.append(source)
+    return unexplained
+
+def request_full_sync(sources):
+    """
+    Makes the next sync of the sources re-read them whole (e.g. the change
+    probe saw an edit the rotating block checksum may not have covered).
+    """
+    with _sync_lock:
+        for source in normalize_sources(sources):
+            for key, state in _sync_state.items():
+                if key[0] == source['url'] and source['worksheet'] in (None, key[1]):
+                    state['syncs_since_full'] = FULL_SYNC_EVERY
+
+def sync_generation(sources):
+    """
+    Generations of the sources' synced frames: equal across two refreshes
+    only if neither brought back different data. None if a source was not synced.
+    """
+    states = [_synced_state(source) for source in normalize_sources(sources)]
+    return None if None in states else tuple(state['generation'] for _, state in states)
+
+def source_revision(source, client):
+    """
+    Cheap change token for one source: the spreadsheet's Drive modifiedTime
+    (one small metadata request), else a sentinel-range checksum. None when
+    no token can be computed, meaning "refresh to be safe".
+    """
+    spreadsheet_id = gspread.utils.extract_id_from_url(source['url'])
+    if spreadsheet_id not in _drive_probe_unavailable:
+        try:
+            return client.http_client.get_file_drive_metadata(spreadsheet_id)['modifiedTime']
+        except gspread.exceptions.APIError as e:
+            if e.code not in (401, 403, 404):
+                raise
+            logger.info("Metadados do Drive indisponíveis para %s (%s); usando linha sentinela", spreadsheet_id, e.code)
+            _drive_probe_unavailable.add(spreadsheet_id)
+    return _sentinel_revision(source, client)
+
+def probe_sources(sources):
+    """
+    Change token for a list of sources (None if any source is unknown).
+    Comparing it with the token of the last refresh tells whether the
+    sheets changed without downloading them.
+    """
+    client = get_gspread_client()
+    if not client:
+        return None
+    with timed("change_probe", sources=len(sources)):
+        revisions = tuple(source_revision(src, client) for src in normalize_sources(sources))
+    incr("change_probes")
+    return None if None in revisions else "|".join(revisions)
+
+def refresh_snapshot(sources, revision=None, generation=None):
+    """
+    Fetches and standardizes all sources, then persists them as the local snapshot.
+    Errors propagate and an empty result never overwrites the last snapshot.
+    Concurrent calls for the same sources are coalesced into one fetch.
+    ``revision`` (from ``probe_sources``) is settled against the synced data
+    and stored with the snapshot. With the ``generation`` of the data the
+    caller has, an unchanged sync returns None and only the snapshot's
+    fetch time and revision are updated.
+    """
+    return _refresh_flight.do(sources_key(sources), lambda: _refresh_snapshot(sources, revision, generation))
+
+def _refresh_snapshot(sources, revision, generation):
+    df = load_sources(sources, generation=generation)
+    if df is not None and df.empty:
+        return df
+    revision = synced_revision(sources, revision)
+    if df is None:
+        try:
+            touch_snapshot(sources_key(sources), revision=revision)
+        except Exception:
+            logger.exception("Falha ao atualizar metadados do snapshot de %s", sources_key(sources))
+        return None
+    try:
+        with timed("snapshot_write", rows=len(df)):
+            save_snapshot(df, sources_key(sources), worksheet=", ".join(df['fonte'].cat.categories), revision=revision)
+    except Exception:
+        logger.exception("Falha ao gravar snapshot local de %s", sources_key(sources))
+    return df
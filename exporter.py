@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import io
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from instrumentation import incr, timed
+from resilience import SingleFlight
+from snapshot_store import mixed_object_columns, to_arrow_safe
+
+# Encoded exports are cached on disk, one file per (source, version, filters, format)
+EXPORT_DIR = os.environ.get("GGE_EXPORT_DIR", ".exports")
+EXPORT_CACHE_MAX_MB = float(os.environ.get("GGE_EXPORT_CACHE_MB", "512"))
+# Rows encoded per chunk: bounds the memory of an export regardless of its size
+EXPORT_CHUNK_ROWS = 50_000
+
+# format -> (label, MIME type, file extension)
+EXPORT_FORMATS = {
+    'csv': ("CSV", "text/csv", "csv"),
+    'csv.gz': ("CSV compactado (.gz)", "application/gzip", "csv.gz"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet", "parquet"),
+}
+
+_export_flight = SingleFlight()
+
+def export_path(key, fmt):
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(EXPORT_DIR, f"{digest}.{EXPORT_FORMATS[fmt][2]}")
+
+def _chunks(df):
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        yield df.iloc[start:start + EXPORT_CHUNK_ROWS]
+
+def _write_csv(df, f):
+    """
+    Encodes the frame chunk by chunk into a binary file (header written once).
+    """
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    if df.empty:
+        df.to_csv(text, index=False)
+    for i, chunk in enumerate(_chunks(df)):
+        chunk.to_csv(text, index=False, header=i == 0)
+    text.flush()
+    text.detach()
+
+def _write_parquet(df, path):
+    """
+    One row group per chunk, so only one chunk is converted to Arrow at a time.
+    Column types are fixed up front from the whole frame and the first chunk.
+    """
+    mixed = mixed_object_columns(df)
+    writer = None
+    try:
+        for chunk in list(_chunks(df)) or [df]:
+            table = pa.Table.from_pandas(to_arrow_safe(chunk, mixed), preserve_index=False)
+            if writer is None:
+                # An all-empty column in the first chunk would be typed null
+                schema = pa.schema(
+                    [f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema],
+                    metadata=table.schema.metadata,
+                )
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _encode(df, fmt, path):
+    """
+    Writes the export to ``path`` and returns its bytes, read from the temp
+    file (which eviction skips) so a concurrent eviction cannot remove them.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if fmt == 'parquet':
+        _write_parquet(df, tmp_path)
+    elif fmt == 'csv.gz':
+        with open(tmp_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as gz:
+            _write_csv(df, gz)
+    else:
+        with open(tmp_path, "wb") as f:
+            _write_csv(df, f)
+    with open(tmp_path, "rb") as f:
+        data = f.read()
+    os.replace(tmp_path, path)
+    return data
+
+def _evict(keep):
+    """
+    Removes the least recently used exports beyond the size cap.
+    """
+    try:
+        entries = [os.path.join(EXPORT_DIR, name) for name in os.listdir(EXPORT_DIR) if not name.endswith(".tmp")]
+        files = sorted((os.stat(p).st_mtime, os.path.getsize(p), p) for p in entries)
+    except OSError:
+        return
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= EXPORT_CACHE_MAX_MB * 2**20:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            incr("export_evictions")
+        except OSError:
+            pass
+
+def export_bytes(dataset, filters, fmt):
+    """
+    The filtered rows of ``dataset`` encoded as ``fmt``. The file is encoded
+    in chunks on the first request only and reused for the same data version
+    and filters; concurrent identical requests share one encoding pass. The
+    bytes are read inside that pass, so another export's eviction can never
+    remove the file between the build and the read.
+    """
+    # fetched_at disambiguates versions across restarts (numbers restart at 1)
+    key = (dataset.source, dataset.version, dataset.fetched_at, tuple(sorted(filters.items())), fmt)
+    path = export_path(key, fmt)
+
+    def build():
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            pass  # not built yet, or evicted meanwhile
+        else:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            incr("export_cache_hit")
+            return data
+        incr("export_cache_miss")
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        rows = dataset.index.take(dataset.df, **filters)
+        with timed("export", format=fmt, rows=len(rows)) as m:
+            data = _encode(rows, fmt, path)
+            m["bytes"] = len(data)
+        _evict(keep=path)
+        return data
+
+    return _export_flight.do(path, build)
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import plotly.io as pio
+import streamlit as st
+from instrumentation import incr, timed
+from resilience import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the serialized figures kept in memory (all sessions together)
+FIGURE_CACHE_MAX_MB = float(os.environ.get("GGE_FIGURE_CACHE_MB", "64"))
+# plotly.js default height, used when the figure layout sets none
+DEFAULT_CHART_HEIGHT = 450
+# Threads building figures off the script thread (shared by all sessions)
+FIGURE_BUILD_WORKERS = int(os.environ.get("GGE_FIGURE_BUILD_WORKERS", "2"))
+
+CachedFigure = namedtuple("CachedFigure", ["spec", "height"])
+
+class FigureCache:
+    """
+    Process-wide LRU of Plotly figures already serialized to JSON, keyed by
+    (dataset source, version, filter selection, chart id) and bounded by the
+    total size of the stored JSON. A hit skips both figure construction and
+    serialization; a new dataset version simply stops matching old keys,
+    which age out of the LRU.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Sessions missing the same key at once (e.g. right after a new
+        # version) share one build
+        self._flight = SingleFlight()
+        self._pool = None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        cost = len(entry.spec)
+        if cost > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.spec)
+            self._entries[key] = entry
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.spec)
+                incr("figure_cache_evictions")
+        return entry
+
+    def get_or_build(self, key, build):
+        """
+        Returns ``(CachedFigure, hit)``; on a miss ``build()`` must return a
+        plotly Figure, which is serialized once and stored.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            incr("figure_cache_hit")
+            return entry, True
+        return self._flight.do(key, lambda: self._build(key, build)), False
+
+    def _build(self, key, build):
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        incr("figure_cache_miss")
+        fig = build()
+        entry = CachedFigure(
+            spec=pio.to_json(fig, validate=False),
+            height=fig.layout.height or DEFAULT_CHART_HEIGHT,
+        )
+        return self.put(key, entry)
+
+    def submit(self, jobs):
+        """
+        Builds ``{chart: (key, build)}`` off the script thread and returns
+        ``{chart: Future of (CachedFigure, hit)}``, so a rerun keeps rendering
+        while its figures are built. The misses of one call are built in order
+        by a single pool task: figure building holds the GIL, so in parallel
+        they would all finish last instead of the first chart appearing
+        early. Different sessions still build concurrently. Hits resolve
+        immediately.
+        """
+        futures = {chart: Future() for chart in jobs}
+        pending = []
+        for chart, (key, build) in jobs.items():
+            entry = self.get(key)
+            if entry is not None:
+                incr("figure_cache_hit")
+                futures[chart].set_result((entry, True))
+            else:
+                pending.append((chart, key, build))
+        if pending:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=FIGURE_BUILD_WORKERS, thread_name_prefix="gge-figure")
+            self._pool.submit(self._build_in_order, pending, futures)
+        return futures
+
+    def _build_in_order(self, pending, futures):
+        for chart, key, build in pending:
+            try:
+                with timed("figure_build", chart=chart) as m:
+                    entry, m["cached"] = self.get_or_build(key, build)
+            except Exception as e:
+                futures[chart].set_exception(e)
+            else:
+                futures[chart].set_result((entry, m["cached"]))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+figure_cache = FigureCache(int(FIGURE_CACHE_MAX_MB * 2**20))
+
+try:
+    from streamlit.elements.lib.form_utils import current_form_id
+    from streamlit.elements.lib.layout_utils import LayoutConfig
+    from streamlit.elements.lib.utils import compute_and_register_element_id
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+except ImportError:  # Streamlit moved its internals: use the public API
+    PlotlyChartProto = None
+
+def plotly_chart_cached(entry):
+    """
+    Displays a CachedFigure full-width. Sends the same message as
+    ``st.plotly_chart`` but reuses the stored JSON instead of validating
+    and re-serializing the figure on every rerun. Falls back to the public
+    API (for good) if Streamlit's internals do not behave as expected.
+    """
+    global PlotlyChartProto
+    if PlotlyChartProto is not None:
+        try:
+            _enqueue_plotly_spec(entry)
+            return
+        except Exception:
+            logger.exception("Envio direto do gráfico falhou; usando st.plotly_chart")
+            incr("figure_fast_path_failed")
+            PlotlyChartProto = None
+    st.plotly_chart(json.loads(entry.spec), width="stretch")
+
+def _enqueue_plotly_spec(entry):
+    """
+    Enqueues the stored spec as a plotly_chart element through Streamlit's
+    internals (written against the pinned Streamlit version).
+    """
+    dg = st._main
+    proto = PlotlyChartProto()
+    proto.theme = "streamlit"
+    proto.form_id = current_form_id(dg)
+    proto.spec = entry.spec
+    proto.config = json.dumps({})
+    proto.id = compute_and_register_element_id(
+        "plotly_chart",
+        user_key=None,
+        key_as_main_identity=False,
+        dg=dg,
+        plotly_spec=proto.spec,
+        plotly_config=proto.config,
+        selection_mode=("points", "box", "lasso"),
+        is_selection_activated=False,
+        theme="streamlit",
+        width="stretch",
+        height="content",
+    )
+    dg._enqueue("plotly_chart", proto, layout_config=LayoutConfig(width="stretch", height=entry.height))
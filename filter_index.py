@@ -0,0 +1,64 @@
+from functools import reduce
+import numpy as np
+
+class FilterIndex:
+    """
+    Inverted index from each value of the filter dimensions to a packed row
+    bitmap (1 bit per row). A filter combination is resolved by AND-ing the
+    selected bitmaps and taking the surviving rows, without masking or
+    copying the full frame on every rerun.
+    """
+
+    DIMS = ('ano', 'mes', 'unidade', 'status_code')
+
+    def __init__(self, n_rows, bitmaps):
+        self.n_rows = n_rows
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def build(cls, df):
+        """
+        One stable sort of the category codes per dimension; each value's rows
+        are a contiguous run of that order.
+        """
+        n_rows = len(df)
+        bitmaps = {}
+        for dim in cls.DIMS:
+            if dim not in df.columns or not hasattr(df[dim], 'cat'):
+                continue
+            codes = df[dim].cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(df[dim].cat.categories) + 1))
+            bitmaps[dim] = {}
+            for k, value in enumerate(df[dim].cat.categories):
+                rows = np.zeros(n_rows, dtype=bool)
+                rows[order[bounds[k]:bounds[k + 1]]] = True
+                bitmaps[dim][value] = np.packbits(rows)
+        return cls(n_rows, bitmaps)
+
+    def positions(self, **filters):
+        """
+        Row positions matching every given ``dim=value`` (None values are
+        ignored). Returns None when nothing is filtered, meaning "all rows".
+        """
+        selected = []
+        for dim, value in filters.items():
+            if value is None or dim not in self.bitmaps:
+                continue
+            bitmap = self.bitmaps[dim].get(value)
+            if bitmap is None:
+                return np.empty(0, dtype=np.int64)
+            selected.append(bitmap)
+        if not selected:
+            return None
+        combined = reduce(np.bitwise_and, selected)
+        return np.flatnonzero(np.unpackbits(combined, count=self.n_rows))
+
+    def take(self, df, **filters):
+        """
+        Rows of ``df`` matching the filters; the frame itself when unfiltered.
+        """
+        positions = self.positions(**filters)
+        if positions is None:
+            return df
+        return df.take(positions)
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, memory is not reported
+    resource = None
+
+# Optional JSON-lines sink for every recorded event (machine-readable log)
+METRICS_LOG = os.environ.get("GGE_METRICS_LOG")
+MAX_EVENTS = 1000
+
+logger = logging.getLogger(__name__)
+
+_events = deque(maxlen=MAX_EVENTS)
+_counters = Counter()
+_lock = threading.Lock()
+
+def _peak_rss_mb():
+    """
+    Peak resident memory of the process (None where it cannot be read).
+    """
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def _rss_mb():
+    """
+    Current resident memory of the process (falls back to peak RSS).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return _peak_rss_mb()
+
+def record(stage, seconds=None, **fields):
+    """
+    Records one event (a timed stage or a point measurement).
+    """
+    event = {
+        "ts": time.time(),
+        "stage": stage,
+        "seconds": seconds,
+        "rss_mb": _rss_mb(),
+        "thread": threading.current_thread().name,
+        **fields,
+    }
+    with _lock:
+        _events.append(event)
+    if METRICS_LOG:
+        try:
+            with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event, default=str) + "\n")
+        except OSError:
+            logger.exception("Falha ao gravar métricas em %s", METRICS_LOG)
+    return event
+
+@contextmanager
+def timed(stage, **fields):
+    """
+    Times the enclosed block. The yielded dict can be filled with extra
+    fields (rows, bytes...) that are recorded with the duration.
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record(stage, time.perf_counter() - start, **fields)
+
+def incr(counter, n=1):
+    with _lock:
+        _counters[counter] += n
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+def recent(n=100):
+    with _lock:
+        return list(_events)[-n:]
+
+def summary():
+    """
+    Per-stage statistics over the retained events.
+    """
+    by_stage = defaultdict(list)
+    for event in recent(MAX_EVENTS):
+        if event["seconds"] is not None:
+            # Per-chart stages are reported separately (figure_build:evolucao, ...)
+            label = f"{event['stage']}:{event['chart']}" if "chart" in event else event["stage"]
+            by_stage[label].append(event["seconds"])
+
+    stats = []
+    for stage, values in sorted(by_stage.items()):
+        ordered = sorted(values)
+        stats.append({
+            "stage": stage,
+            "count": len(values),
+            "last_ms": values[-1] * 1000,
+            "mean_ms": sum(values) / len(values) * 1000,
+            "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+            "max_ms": ordered[-1] * 1000,
+        })
+    return stats
+
+def snapshot():
+    """
+    Everything the diagnostics panel / metrics endpoint exposes, as plain JSON.
+    """
+    return {
+        "pid": os.getpid(),
+        "rss_mb": _rss_mb(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "counters": counters(),
+        "stages": summary(),
+        "recent": recent(50),
+    }
+
+def track_http_session(session):
+    """
+    Counts requests and response bytes of a requests.Session (e.g. the
+    gspread client's), so fetch stages can report bytes transferred.
+    """
+    def on_response(response, *args, **kwargs):
+        incr("sheets_requests")
+        incr("sheets_bytes", len(response.content or b""))
+        return response
+
+    if session is not None:
+        session.hooks.setdefault("response", []).append(on_response)
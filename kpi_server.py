@@ -0,0 +1,183 @@
+"""
+Headless KPI endpoint: serves the dashboard's indicators as JSON without a
+Streamlit session, for wall TVs, reports and other consumers.
+
+    python kpi_server.py --port 8601
+
+    GET /kpis?ano=2025&mes=Janeiro&unidade=CENTRO   KPIs for the filters (all optional), with
+                                                     period comparisons when a year is selected
+    GET /health                                      data version, age and refresh status
+
+Responses carry an ETag derived from the data version and the filters, so
+clients polling with If-None-Match get a 304 (no body, no computation) until
+the sheet actually changes. With GGE_SHARED_DIR set, this process joins the
+dashboard processes as one more reader of the shared dataset.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from data_loader import DEFAULT_SHEET_URL, configured_sources
+from instrumentation import incr, timed
+from kpis import compare_periods, compute_kpis, parse_filters
+from refresher import DatasetRefresher
+from shared_dataset import SHARED_DIR, SharedDatasetRefresher
+
+logger = logging.getLogger(__name__)
+
+KPI_HOST = os.environ.get("GGE_KPI_HOST", "127.0.0.1")
+KPI_PORT = int(os.environ.get("GGE_KPI_PORT", "8601"))
+REFRESH_INTERVAL = 30  # seconds between change probes of the sheet (same as the dashboard)
+# Clients may reuse a response this long before revalidating with the ETag
+KPI_MAX_AGE = 5
+# Encoded responses kept per (data version, filters)
+KPI_CACHE_ENTRIES = 256
+
+class KpiCache:
+    """
+    Small LRU of encoded JSON bodies keyed by ETag. A new data version
+    changes every ETag, so entries never need invalidation, only eviction.
+    """
+
+    def __init__(self, max_entries=KPI_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, etag, build):
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+                incr("kpi_cache_hit")
+                return body
+        incr("kpi_cache_miss")
+        body = build()
+        with self._lock:
+            self._entries[etag] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+def kpi_etag(dataset, filters):
+    key = (dataset.source, dataset.version, dataset.fetched_at, tuple(sorted(filters.items())))
+    return '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + '"'
+
+def kpi_body(dataset, filters):
+    payload = {
+        'version': dataset.version,
+        'fetched_at': dataset.fetched_at,
+        **compute_kpis(dataset, **filters).to_dict(),
+        'comparisons': [c.to_dict() for c in compare_periods(dataset, **filters)],
+    }
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+class KpiHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    refresher = None
+    cache = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        with timed("kpi_request", path=url.path) as m:
+            if url.path == "/kpis":
+                m["status"] = self._kpis(url.query)
+            elif url.path == "/health":
+                m["status"] = self._health()
+            else:
+                m["status"] = self._json(404, {'error': "Caminho não encontrado. Use /kpis ou /health."})
+
+    def _kpis(self, query):
+        dataset = self.refresher.latest()
+        if dataset is None:
+            return self._json(503, {'error': "Dados ainda não carregados."}, retry_after=REFRESH_INTERVAL)
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        try:
+            filters = parse_filters(dataset, params)
+        except ValueError as e:
+            return self._json(400, {'error': str(e)})
+
+        etag = kpi_etag(dataset, filters)
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            incr("kpi_not_modified")
+            self.send_response(304)
+            self._cache_headers(etag)
+            self.end_headers()
+            return 304
+        body = self.cache.get_or_build(etag, lambda: kpi_body(dataset, filters))
+        return self._send(200, body, etag=etag)
+
+    def _health(self):
+        dataset = self.refresher.latest()
+        payload = {
+            'version': dataset.version if dataset else None,
+            'fetched_at': dataset.fetched_at if dataset else None,
+            'age_seconds': round(time.time() - dataset.fetched_at, 1) if dataset else None,
+            'rows': len(dataset.df) if dataset else 0,
+            'stale': self.refresher.is_stale(),
+            'last_error': self.refresher.last_error,
+        }
+        return self._json(200 if dataset else 503, payload)
+
+    def _cache_headers(self, etag):
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"max-age={KPI_MAX_AGE}")
+
+    def _json(self, status, payload, retry_after=None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        return self._send(status, body, retry_after=retry_after)
+
+    def _send(self, status, body, etag=None, retry_after=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self._cache_headers(etag)
+        else:
+            self.send_header("Cache-Control", "no-cache")
+        if retry_after:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+def make_server(refresher, host=KPI_HOST, port=KPI_PORT):
+    """
+    HTTP server answering from ``refresher.latest()`` (not started).
+    """
+    handler = type("BoundKpiHandler", (KpiHandler,), {'refresher': refresher, 'cache': KpiCache()})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=KPI_HOST)
+    parser.add_argument('--port', type=int, default=KPI_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    sources = configured_sources(DEFAULT_SHEET_URL)
+    if SHARED_DIR:
+        refresher = SharedDatasetRefresher(sources, SHARED_DIR, interval=REFRESH_INTERVAL).start()
+    else:
+        refresher = DatasetRefresher(sources, interval=REFRESH_INTERVAL).start()
+    server = make_server(refresher, args.host, args.port)
+    logger.info("KPIs disponíveis em http://%s:%d/kpis", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        refresher.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from cube import AggregateCube
+
+FILTER_DIMS = AggregateCube.FILTER_DIMS
+# Months of resolved-rate history returned with each comparison
+TREND_PERIODS = 6
+# 'mes' categories start with the calendar months; labels the standardizer
+# could not map (e.g. "3") are appended after them and are not periods
+MONTHS_PER_YEAR = 12
+
+@dataclass(frozen=True)
+class KpiSummary:
+    """
+    Every indicator shown on the dashboard for one filter combination.
+    ``resolved`` and ``resolved_pct`` are None when the sheet has no status
+    column; ``top_unit`` is None when the selection is empty.
+    """
+    filters: dict
+    total: int
+    resolved: object
+    resolved_pct: object
+    units: int
+    top_unit: object
+    unit_performance: pd.DataFrame
+
+    def to_dict(self):
+        """
+        JSON-ready form (plain Python types, one record per unidade).
+        """
+        perf = self.unit_performance
+        records = [
+            {
+                'unidade': str(row['unidade']),
+                'total': int(row['Total']),
+                'resolvidos': int(row['Resolvidos']) if 'Resolvidos' in perf.columns else None,
+                'taxa_pct': float(row['Taxa %']) if 'Taxa %' in perf.columns else None,
+            }
+            for _, row in perf.iterrows()
+        ]
+        return {
+            'filters': self.filters,
+            'total': self.total,
+            'resolved': self.resolved,
+            'resolved_pct': self.resolved_pct,
+            'units': self.units,
+            'top_unit': self.top_unit,
+            'unit_performance': records,
+        }
+
+def compute_kpis(dataset, ano=None, mes=None, unidade=None):
+    """
+    Computes the KPIs of a DatasetVersion for the given filters (None = all)
+    from its pre-aggregated cube, without touching the raw rows. Used by the
+    dashboard and by the headless endpoint (kpi_server.py).
+    """
+    filters = {'ano': ano, 'mes': mes, 'unidade': unidade}
+    cube = dataset.cube
+    sl = cube.slice(**filters)
+    total = cube.total(sl)
+    resolved = cube.resolved(sl)
+    unit_counts = cube.by_unit(sl)
+    resolved_pct = None
+    if resolved is not None:
+        resolved_pct = round(resolved / total * 100, 1) if total > 0 else 0.0
+    return KpiSummary(
+        filters=filters,
+        total=total,
+        resolved=resolved,
+        resolved_pct=resolved_pct,
+        units=int((unit_counts > 0).sum()),
+        top_unit=str(unit_counts.index[0]) if total > 0 and not unit_counts.empty else None,
+        unit_performance=cube.unit_performance(sl) if 'unidade' in sl.columns else pd.DataFrame(),
+    )
+
+def filter_values(dataset, dim):
+    """
+    Values present in the data for a filter dimension, as shown in the filter bar.
+    """
+    counts = dataset.cube.counts
+    if dim not in counts.columns:
+        return []
+    values = counts[dim].dropna().unique()
+    # 'mes' is an ordered categorical (calendar order); the others sort by value
+    return values.sort_values().tolist() if dim == 'mes' else sorted(values.tolist())
+
+def parse_filters(dataset, params):
+    """
+    Validates filter values coming from outside the dashboard (query string).
+    Raises ValueError naming the dimension and the accepted values.
+    """
+    filters = {}
+    for dim in FILTER_DIMS:
+        value = params.get(dim)
+        if value in (None, ''):
+            filters[dim] = None
+            continue
+        allowed = filter_values(dataset, dim)
+        if value not in allowed:
+            raise ValueError(f"Valor inválido para '{dim}': {value!r}. Valores aceitos: {allowed}")
+        filters[dim] = value
+    return filters
+
+class PeriodTotals:
+    """
+    Total and resolved occurrences per (month, unidade), with months as
+    integer keys (year * 12 + month index). Built once per dataset version
+    from the aggregate cube; any period's KPIs are then a lookup in a table
+    of years x 12 x unidades rows, however many occurrences accumulate.
+    """
+
+    def __init__(self, table, month_names, has_status):
+        self.table = table
+        self.month_names = month_names
+        self.has_status = has_status
+        self.latest_key = int(table['periodo'].max()) if len(table) else None
+
+    @classmethod
+    def build(cls, cube):
+        counts = cube.counts
+        if 'ano' not in counts.columns or 'mes' not in counts.columns:
+            return cls(pd.DataFrame(columns=['periodo', 'unidade', 'total', 'resolvidos']), [], False)
+        year = pd.to_numeric(counts['ano'].astype(object), errors='coerce').to_numpy()
+        month = counts['mes'].cat.codes.to_numpy()
+        keep = ~np.isnan(year) & (month >= 0) & (month < MONTHS_PER_YEAR)
+        keys = pd.DataFrame({'periodo': (year[keep] * 12 + month[keep]).astype('int64')})
+        keys['unidade'] = counts['unidade'].array[keep] if 'unidade' in counts.columns else "-"
+        n = counts['n'].to_numpy()[keep]
+        has_status = 'resolvido' in counts.columns
+        keys['total'] = n
+        keys['resolvidos'] = np.where(counts['resolvido'].to_numpy()[keep], n, 0) if has_status else 0
+        table = keys.groupby(['periodo', 'unidade'], observed=True, sort=True)[['total', 'resolvidos']].sum().reset_index()
+        return cls(table, list(counts['mes'].cat.categories), has_status)
+
+    def period_key(self, ano, mes=None):
+        """
+        Integer key of a filter-bar selection (None if it is not a calendar period).
+        """
+        try:
+            year = int(ano)
+        except (TypeError, ValueError):
+            return None
+        if mes is None:
+            return year * 12
+        calendar = self.month_names[:MONTHS_PER_YEAR]
+        return year * 12 + calendar.index(mes) if mes in calendar else None
+
+    def label(self, key, whole_year=False):
+        year, month = divmod(key, 12)
+        return str(year) if whole_year else f"{self.month_names[month]}/{year}"
+
+    def by_unit(self, keys, unidade=None):
+        """
+        Totals per unidade over a set of period keys.
+        """
+        sl = self.table[self.table['periodo'].isin(keys)]
+        if unidade is not None:
+            sl = sl[sl['unidade'] == unidade]
+        return sl.groupby('unidade', observed=True)[['total', 'resolvidos']].sum()
+
+    def resolved_trend(self, end_key, unidade=None, periods=TREND_PERIODS):
+        """
+        Monthly resolved rate (%) for the ``periods`` months ending at ``end_key``.
+        """
+        keys = range(end_key - periods + 1, end_key + 1)
+        sl = self.table[self.table['periodo'].isin(keys)]
+        if unidade is not None:
+            sl = sl[sl['unidade'] == unidade]
+        per_month = sl.groupby('periodo')[['total', 'resolvidos']].sum().reindex(keys, fill_value=0)
+        return [
+            {'periodo': self.label(k), 'total': int(row.total), 'resolved_pct': _pct(row.resolvidos, row.total) if self.has_status else None}
+            for k, row in zip(keys, per_month.itertuples())
+        ]
+
+def _pct(part, whole):
+    return round(part / whole * 100, 1) if whole > 0 else None
+
+def _optional(value, cast):
+    return None if value is None or pd.isna(value) else cast(value)
+
+@dataclass(frozen=True)
+class PeriodComparison:
+    """
+    KPIs of the selected period against a reference period, plus per-unidade
+    deltas and rank changes (rank 1 = most occurrences). Percentages are
+    None when a period has no occurrences or the sheet has no status column.
+    """
+    label: str
+    period: str
+    previous_period: str
+    total: int
+    previous_total: int
+    resolved_pct: object
+    previous_resolved_pct: object
+    units: int
+    previous_units: int
+    top_unit: object
+    previous_top_unit: object
+    unit_deltas: pd.DataFrame
+    trend: list
+
+    @property
+    def total_change_pct(self):
+        return round((self.total - self.previous_total) / self.previous_total * 100, 1) if self.previous_total else None
+
+    @property
+    def resolved_pct_change(self):
+        if self.resolved_pct is None or self.previous_resolved_pct is None:
+            return None
+        return round(self.resolved_pct - self.previous_resolved_pct, 1)
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'period': self.period,
+            'previous_period': self.previous_period,
+            'total': self.total,
+            'previous_total': self.previous_total,
+            'total_change_pct': self.total_change_pct,
+            'resolved_pct': self.resolved_pct,
+            'previous_resolved_pct': self.previous_resolved_pct,
+            'resolved_pct_change': self.resolved_pct_change,
+            'units': self.units,
+            'previous_units': self.previous_units,
+            'top_unit': self.top_unit,
+            'previous_top_unit': self.previous_top_unit,
+            'unit_deltas': [
+                {
+                    'unidade': row['unidade'],
+                    **{k: int(row[k]) for k in ('total', 'total_anterior', 'delta_total')},
+                    'resolved_pct_delta': _optional(row['resolved_pct_delta'], float),
+                    **{k: _optional(row[k], int) for k in ('posicao', 'posicao_anterior', 'delta_posicao')},
+                }
+                for row in self.unit_deltas.to_dict('records')
+            ],
+            'resolved_trend': self.trend,
+        }
+
+def _compare(periods, label, current_keys, previous_keys, current_label, previous_label, unidade, trend_end):
+    now = periods.by_unit(current_keys, unidade)
+    before = periods.by_unit(previous_keys, unidade)
+    units = now[['total', 'resolvidos']].join(before, how='outer', rsuffix='_anterior').fillna(0).astype('int64')
+    units = units[(units['total'] > 0) | (units['total_anterior'] > 0)]
+    rank = units['total'].where(units['total'] > 0).rank(ascending=False, method='min')
+    previous_rank = units['total_anterior'].where(units['total_anterior'] > 0).rank(ascending=False, method='min')
+    deltas = pd.DataFrame({
+        'unidade': units.index.astype(str),
+        'total': units['total'].to_numpy(),
+        'total_anterior': units['total_anterior'].to_numpy(),
+        'delta_total': (units['total'] - units['total_anterior']).to_numpy(),
+        'resolved_pct_delta': [
+            round(a - b, 1) if a is not None and b is not None and periods.has_status else None
+            for a, b in zip(map(_pct, units['resolvidos'], units['total']),
+                            map(_pct, units['resolvidos_anterior'], units['total_anterior']))
+        ],
+        'posicao': rank.to_numpy(),
+        'posicao_anterior': previous_rank.to_numpy(),
+    })
+    # Positive = climbed in the ranking (fewer units ahead than before)
+    deltas['delta_posicao'] = deltas['posicao_anterior'] - deltas['posicao']
+
+    def top(col):
+        return str(units[col].idxmax()) if len(units) and units[col].max() > 0 else None
+
+    total, previous_total = int(units['total'].sum()), int(units['total_anterior'].sum())
+    return PeriodComparison(
+        label=label,
+        period=current_label,
+        previous_period=previous_label,
+        total=total,
+        previous_total=previous_total,
+        resolved_pct=_pct(int(units['resolvidos'].sum()), total) if periods.has_status else None,
+        previous_resolved_pct=_pct(int(units['resolvidos_anterior'].sum()), previous_total) if periods.has_status else None,
+        units=int((units['total'] > 0).sum()),
+        previous_units=int((units['total_anterior'] > 0).sum()),
+        top_unit=top('total'),
+        previous_top_unit=top('total_anterior'),
+        unit_deltas=deltas.sort_values('total', ascending=False, kind='stable').reset_index(drop=True),
+        trend=periods.resolved_trend(trend_end, unidade),
+    )
+
+def compare_periods(dataset, ano=None, mes=None, unidade=None):
+    """
+    Period-over-period comparisons for a filter selection: a month against
+    the previous month and the same month a year before, a year against the
+    previous year. Empty when no year is selected (no single period).
+    """
+    periods = dataset.periods
+    key = periods.period_key(ano, mes)
+    if key is None:
+        return []
+    if mes is not None:
+        return [
+            _compare(periods, "mês anterior", [key], [key - 1], periods.label(key), periods.label(key - 1), unidade, key),
+            _compare(periods, "mesmo mês do ano anterior", [key], [key - 12], periods.label(key), periods.label(key - 12), unidade, key),
+        ]
+    # The trend of a year ends at its last month with data (the current month)
+    trend_end = min(key + 11, periods.latest_key) if periods.latest_key is not None else key + 11
+    return [
+        _compare(periods, "ano anterior", range(key, key + 12), range(key - 12, key), periods.label(key, whole_year=True),
+                 periods.label(key - 12, whole_year=True), unidade, trend_end),
+    ]
@@ -0,0 +1,256 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+import pandas as pd
+from cube import AggregateCube
+from filter_index import FilterIndex
+from kpis import PeriodTotals
+from rollup import TimeRollup
+from sort_index import SortIndex
+from instrumentation import incr, timed
+from data_loader import (
+    column_plan, normalize_sources, probe_sources, refresh_snapshot, request_full_sync, sources_key,
+    sync_generation, synced_revision, unexplained_changes
+)
+from snapshot_store import read_snapshot
+
+logger = logging.getLogger(__name__)
+
+# After a failed refresh the next attempt comes sooner (with jitter), doubling
+# up to the regular interval, while the last good version keeps being served.
+RETRY_BASE_SECONDS = 5
+# Even when the change probe reports nothing new, re-sync at least this often
+# (the sentinel-row fallback cannot see edits to old rows).
+MAX_AGE_SECONDS = 15 * 60
+
+@dataclass(frozen=True)
+class DatasetVersion:
+    """
+    An immutable, published version of the standardized dataset.
+    Sessions must treat ``df`` as read-only (filter into new frames, never mutate).
+    """
+    version: int
+    df: pd.DataFrame
+    fetched_at: float
+    source: str
+
+    @cached_property
+    def occ_col(self):
+        return column_plan(self.df.columns).occ_col
+
+    @cached_property
+    def status_col(self):
+        return column_plan(self.df.columns).status_col
+
+    @cached_property
+    def cube(self):
+        return AggregateCube.build(self.df, status_col=self.status_col, occ_col=self.occ_col)
+
+    @cached_property
+    def index(self):
+        return FilterIndex.build(self.df)
+
+    @cached_property
+    def rollup(self):
+        return TimeRollup.build(self.df)
+
+    @cached_property
+    def sort_index(self):
+        return SortIndex.build(self.df)
+
+    @cached_property
+    def periods(self):
+        return PeriodTotals.build(self.cube)
+
+    def warm(self):
+        """
+        Builds the derived structures up front (called from the refresher thread).
+        """
+        self.cube
+        self.index
+        self.rollup
+        self.sort_index
+        self.periods
+        return self
+
+def prepare_dataset(df):
+    """
+    Work done once per version instead of once per session rerun.
+    """
+    if not df.empty and 'data_dt' in df.columns:
+        df = df.sort_values('data_dt', ascending=False)
+    return df
+
+class DatasetRefresher:
+    """
+    Probes the configured sources for changes on its own schedule in a single
+    daemon thread and, only when they changed, fetches them and atomically
+    publishes a new DatasetVersion. Streamlit sessions only read ``latest()``,
+    so N open tabs share one fetch per change and page reruns never wait on
+    the network.
+    """
+
+    def __init__(self, sources, interval=60, max_age=MAX_AGE_SECONDS):
+        self.sources = normalize_sources(sources)
+        self.source_key = sources_key(self.sources)
+        self.interval = interval
+        self.max_age = max_age
+        self._revision = None
+        # Sync generation of the published data and when it was last confirmed
+        self._generation = None
+        self._checked_at = 0.0
+        self._latest = None
+        self._version = 0
+        self._published = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_error = None
+        self.last_attempt_at = None
+        self.failures = 0
+
+    def start(self):
+        """
+        Seeds the first version from the local snapshot and starts polling.
+        """
+        if self._thread is not None:
+            return self
+        with timed("snapshot_read"):
+            df, meta = read_snapshot(self.source_key)
+        if df is not None:
+            self._revision = meta.get('revision')
+            self._checked_at = meta.get('fetched_at', time.time())
+            self._publish(df, self._checked_at)
+        self._thread = threading.Thread(target=self._run, name="gge-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def latest(self):
+        """
+        Returns the most recent DatasetVersion (None until the first load).
+        """
+        return self._latest
+
+    def wait_for_data(self, timeout=None):
+        """
+        Blocks until a first version exists (cold start without snapshot only)
+        or a refresh attempt fails.
+        """
+        with self._published:
+            self._published.wait_for(lambda: self._latest is not None or self.last_error is not None, timeout=timeout)
+        return self._latest
+
+    def is_stale(self):
+        """
+        True when the last refresh failed and an older version is being served.
+        """
+        return self.last_error is not None
+
+    def poll(self):
+        """
+        One scheduler tick: a cheap change probe, then a refresh only if the
+        sources changed, the probe cannot tell, the data is older than
+        ``max_age`` or the previous attempt failed.
+        """
+        try:
+            revision = probe_sources(self.sources)
+        except Exception as e:
+            # A failed probe only means "can't tell"; the refresh decides
+            logger.warning("Falha na verificação de mudanças de %s: %s", self.source_key, e)
+            revision = None
+        latest = self._latest
+        if (
+            revision is not None
+            and revision == self._revision
+            and latest is not None
+            and time.time() - self._checked_at < self.max_age
+            and not self.is_stale()
+        ):
+            incr("refresh_skipped")
+            return latest
+        return self.refresh_now(revision)
+
+    def refresh_now(self, revision=None):
+        """
+        Fetches the sheet once and publishes a new version if different data
+        came back (the current version otherwise). On failure the previous
+        version keeps being served and the error is re-raised after being
+        recorded.
+        """
+        self.last_attempt_at = time.time()
+        # Unchanged data comes back as None, without being standardized again
+        known = self._generation if self._latest is not None else None
+        try:
+            df = refresh_snapshot(self.sources, revision=revision, generation=known)
+            edited = unexplained_changes(self.sources, revision, self._revision)
+            if edited:
+                # The probe saw a change that was not an append (an edit the delta
+                # sync's block checksum may have missed): re-read those sources in
+                # full before the new token is trusted
+                incr("sync_forced_full", len(edited))
+                request_full_sync(edited)
+                df = refresh_snapshot(self.sources, revision=revision, generation=known)
+            if df is not None and df.empty:
+                raise ValueError("A planilha não retornou dados")
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        self.failures = 0
+        self.last_error = None
+        # The token of the data just synced, not the one probed before the sync
+        self._revision = synced_revision(self.sources, revision)
+        self._checked_at = time.time()
+        if df is None:
+            incr("refresh_unchanged")
+            return self._latest
+        self._generation = sync_generation(self.sources)
+        return self._publish(df, self._checked_at)
+
+    def _record_failure(self, error):
+        self.failures += 1
+        incr("refresh_failures")
+        if self._latest is not None:
+            incr("stale_served")
+        with self._published:
+            self.last_error = str(error) or type(error).__name__
+            # Wakes sessions waiting for a first version that will not come yet
+            self._published.notify_all()
+
+    def _next_delay(self):
+        if not self.failures:
+            return self.interval
+        backoff = RETRY_BASE_SECONDS * 2 ** (self.failures - 1)
+        return random.uniform(0.5, 1.0) * min(self.interval, backoff)
+
+    def _publish(self, df, fetched_at, version=None, prepared=False):
+        """
+        Swaps in a new version. ``version`` overrides the local counter and
+        ``prepared`` skips prepare_dataset (both used by the shared-memory mode).
+        """
+        with self._published, timed("publish_version", rows=len(df)):
+            if not prepared:
+                df = prepare_dataset(df)
+            self._version = version if version is not None else self._version + 1
+            # Derived structures are built before the swap, never by a session
+            self._latest = DatasetVersion(
+                version=self._version,
+                df=df,
+                fetched_at=fetched_at,
+                source=self.source_key,
+            ).warm()
+            self._published.notify_all()
+        incr("versions_published")
+        return self._latest
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Falha ao atualizar dados de %s (tentativa %d)", self.source_key, self.failures)
+            self._stop.wait(self._next_delay())
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+import gspread
+import requests
+from gspread.http_client import HTTPClient
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from instrumentation import incr, record
+
+# Sheets API read quota is per minute; stay under it across every session of the process
+SHEETS_READS_PER_MINUTE = int(os.environ.get("GGE_SHEETS_READS_PER_MINUTE", "60"))
+RETRY_ATTEMPTS = 5
+RETRY_BASE_WAIT = float(os.environ.get("GGE_RETRY_BASE_WAIT", "0.5"))  # seconds, first backoff window
+RETRY_MAX_WAIT = 32  # seconds, cap of the exponential backoff
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: ``rate_per_minute`` tokens refill continuously,
+    up to ``burst``. ``acquire`` blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, rate_per_minute // 6)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, sleeping as needed. Returns the seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+sheets_limiter = TokenBucket(SHEETS_READS_PER_MINUTE)
+
+def is_retryable(exc):
+    """
+    Rate limiting, server-side errors and transport failures are retried;
+    anything else (403, 404, bad request) fails immediately.
+    """
+    if isinstance(exc, gspread.exceptions.APIError):
+        return getattr(exc.response, "status_code", None) in RETRYABLE_STATUS
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+def _backoff(retry_state):
+    """
+    Exponential backoff with full jitter, never shorter than Retry-After.
+    """
+    wait = wait_random_exponential(multiplier=RETRY_BASE_WAIT, max=RETRY_MAX_WAIT)(retry_state)
+    exc = retry_state.outcome.exception()
+    response = getattr(exc, "response", None)
+    retry_after = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if retry_after and str(retry_after).isdigit():
+        wait = max(wait, float(retry_after))
+    return wait
+
+def _log_retry(retry_state):
+    incr("sheets_retries")
+    record("sheets_retry", None, attempt=retry_state.attempt_number, error=str(retry_state.outcome.exception())[:200])
+
+def call_with_retry(fn, attempts=RETRY_ATTEMPTS):
+    """
+    Runs ``fn`` retrying transient failures with jittered exponential backoff.
+    """
+    for attempt in Retrying(
+        retry=retry_if_exception(is_retryable),
+        wait=_backoff,
+        stop=stop_after_attempt(attempts),
+        before_sleep=_log_retry,
+        reraise=True,
+    ):
+        with attempt:
+            return fn()
+
+class ResilientHTTPClient(HTTPClient):
+    """
+    gspread HTTP client whose every request goes through the process-wide
+    rate limiter and the retry policy.
+    """
+
+    def request(self, *args, **kwargs):
+        def send():
+            waited = sheets_limiter.acquire()
+            if waited:
+                incr("sheets_throttled_seconds", waited)
+            return super(ResilientHTTPClient, self).request(*args, **kwargs)
+        return call_with_retry(send)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, the others wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            incr("fetch_coalesced")
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["done"].set()
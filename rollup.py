@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+class TimeRollup:
+    """
+    Daily occurrence counts per (ano, mes, unidade, status), built once per
+    dataset version. The evolution chart re-buckets these days into weeks,
+    months or years and computes moving averages, so its cost follows the
+    number of time buckets instead of the number of occurrences.
+    """
+
+    FILTER_DIMS = ('ano', 'mes', 'unidade')
+    # granularity -> (pandas period frequency, bucket label format)
+    GRANULARITIES = {
+        'dia': ('D', '%d/%m/%y'),
+        'semana': ('W-SUN', '%d/%m/%y'),
+        'mes': ('M', '%b/%y'),
+        'ano': ('Y', '%Y'),
+    }
+
+    def __init__(self, daily):
+        self.daily = daily
+
+    @classmethod
+    def build(cls, df):
+        """
+        One grouping pass over integer day numbers and category codes.
+        Rows without a parseable date are left out of the time series.
+        """
+        if 'data_dt' not in df.columns:
+            return cls(pd.DataFrame(columns=['dia', 'n']))
+        days = df['data_dt'].to_numpy(dtype='datetime64[D]')
+        keep = ~np.isnat(days)
+        keys = pd.DataFrame({'dia': days[keep]})
+        for dim in cls.FILTER_DIMS + ('status_code',):
+            if dim in df.columns:
+                keys[dim] = df[dim].array[keep]
+        daily = (
+            keys.groupby(list(keys.columns), dropna=False, observed=True, sort=False)
+            .size()
+            .reset_index(name='n')
+        )
+        return cls(daily)
+
+    def slice(self, ano=None, mes=None, unidade=None):
+        sl = self.daily
+        for dim, value in (('ano', ano), ('mes', mes), ('unidade', unidade)):
+            if value is not None and dim in sl.columns:
+                sl = sl[sl[dim] == value]
+        return sl
+
+    def series(self, granularity='mes', window=None, **filters):
+        """
+        Counts per time bucket for the filtered selection, in chronological
+        order with empty buckets filled with zero, plus an optional moving
+        average over ``window`` buckets.
+        """
+        freq, label_format = self.GRANULARITIES[granularity]
+        columns = ['periodo', 'Registros'] + (['Média móvel'] if window else [])
+        sl = self.slice(**filters)
+        if sl.empty:
+            return pd.DataFrame(columns=columns)
+
+        per_day = sl.groupby('dia')['n'].sum()
+        buckets = per_day.groupby(per_day.index.to_period(freq)).sum()
+        buckets = buckets.reindex(pd.period_range(buckets.index.min(), buckets.index.max(), freq=freq), fill_value=0)
+
+        out = pd.DataFrame({
+            'periodo': buckets.index.start_time.strftime(label_format),
+            'Registros': buckets.to_numpy(),
+        })
+        if window:
+            out['Média móvel'] = buckets.rolling(window, min_periods=1).mean().round(1).to_numpy()
+        return out
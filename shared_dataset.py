@@ -0,0 +1,201 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import pandas as pd
+import pyarrow as pa
+from instrumentation import incr, timed
+from refresher import DatasetRefresher, prepare_dataset
+from snapshot_store import read_snapshot, to_arrow_safe
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, the shared mode is unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Multi-process mode: set to a directory shared by every server process
+SHARED_DIR = os.environ.get("GGE_SHARED_DIR")
+# How often workers look for a newer version in the manifest (seconds)
+SHARED_SYNC_INTERVAL = 1.0
+# Dataset files kept besides the current one (late readers of the previous manifest)
+SHARED_KEEP_FILES = 2
+
+def _string_as_arrow(arrow_type):
+    # Strings stay Arrow-backed (zero-copy over the mapped file) instead of
+    # becoming one Python object per cell in every process
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+class SharedDatasetStore:
+    """
+    One published dataset per source set, as an uncompressed Arrow IPC file
+    that every process memory-maps, plus a JSON manifest (version counter,
+    file name, fetch time) replaced atomically on each publish. The page
+    cache holds a single copy of the data no matter how many processes map it.
+    """
+
+    def __init__(self, shared_dir, source_key):
+        digest = hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(shared_dir, digest)
+        self.source_key = source_key
+        self._lock_file = None
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _write_json(self, name, payload):
+        tmp_path = f"{self._file(name)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self._file(name))
+
+    def _read_json(self, name):
+        try:
+            with open(self._file(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def try_acquire_loader(self):
+        """
+        Non-blocking election: the process holding the lock file is the only
+        one fetching the sheet. The lock dies with its process, so another
+        worker takes over on its next attempt.
+        """
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self._file("loader.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def read_manifest(self):
+        return self._read_json("manifest.json")
+
+    def read_status(self):
+        return self._read_json("status.json")
+
+    def write_status(self, **status):
+        self._write_json("status.json", {**status, "loader_pid": os.getpid(), "updated_at": time.time()})
+
+    def publish(self, df, fetched_at):
+        """
+        Writes a prepared frame as the next version (loader only).
+        """
+        manifest = self.read_manifest() or {}
+        version = manifest.get("version", 0) + 1
+        name = f"dataset-{version:08d}.arrow"
+        table = pa.Table.from_pandas(to_arrow_safe(df), preserve_index=False).combine_chunks()
+        tmp_path = f"{self._file(name)}.{os.getpid()}.tmp"
+        with timed("shared_publish", rows=len(df), version=version):
+            # One record batch, uncompressed: every column maps as one contiguous buffer
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, self._file(name))
+            self._write_json("manifest.json", {
+                "version": version,
+                "file": name,
+                "source": self.source_key,
+                "rows": len(df),
+                "fetched_at": fetched_at,
+                "published_at": time.time(),
+            })
+        for old in sorted(glob.glob(self._file("dataset-*.arrow")))[:-(SHARED_KEEP_FILES + 1)]:
+            try:
+                os.remove(old)  # processes still mapping it keep their pages
+            except OSError:
+                pass
+        return version
+
+    def map(self, manifest):
+        """
+        Memory-maps the manifest's dataset file as a DataFrame.
+        """
+        with timed("shared_map", version=manifest["version"]):
+            source = pa.memory_map(self._file(manifest["file"]), "r")
+            table = pa.ipc.open_file(source).read_all()
+            return table.to_pandas(split_blocks=True, types_mapper=_string_as_arrow)
+
+class SharedDatasetRefresher(DatasetRefresher):
+    """
+    DatasetRefresher for several server processes sharing one dataset: the
+    elected loader fetches (with change detection) and publishes into the
+    SharedDatasetStore; every process, the loader included, maps the newest
+    version from the manifest, so all of them serve the same version number
+    within ``sync_interval`` and hold no private copy of the rows.
+    """
+
+    def __init__(self, sources, shared_dir, interval=60, sync_interval=SHARED_SYNC_INTERVAL, **kwargs):
+        if fcntl is None:
+            raise RuntimeError("O modo multiprocesso (GGE_SHARED_DIR) requer fcntl (Linux/macOS)")
+        super().__init__(sources, interval=interval, **kwargs)
+        self.store = SharedDatasetStore(shared_dir, self.source_key)
+        self.sync_interval = sync_interval
+        self.is_loader = False
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._sync_from_store()
+        self._thread = threading.Thread(target=self._run, name="gge-shared-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _become_loader(self):
+        self.is_loader = True
+        incr("shared_loader_elected")
+        logger.info("Processo %d assumiu a carga compartilhada de %s", os.getpid(), self.source_key)
+        if self.store.read_manifest() is None:
+            # Empty store: seed it from the local Parquet snapshot, if any
+            with timed("snapshot_read"):
+                df, meta = read_snapshot(self.source_key)
+            if df is not None:
+                self._revision = meta.get('revision')
+                self._checked_at = meta.get('fetched_at', time.time())
+                self.store.publish(prepare_dataset(df), self._checked_at)
+
+    def _publish(self, df, fetched_at, version=None, prepared=False):
+        # Loader path (refresh_now): publish for everyone, then map it like a worker
+        self.store.publish(df if prepared else prepare_dataset(df), fetched_at)
+        return self._sync_from_store()
+
+    def _sync_from_store(self):
+        manifest = self.store.read_manifest()
+        if manifest is not None and (self._latest is None or manifest["version"] > self._latest.version):
+            try:
+                df = self.store.map(manifest)
+            except OSError:
+                # Replaced between reading the manifest and opening the file
+                return self._latest
+            super()._publish(df, manifest["fetched_at"], version=manifest["version"], prepared=True)
+        if not self.is_loader:
+            status = self.store.read_status() or {}
+            self.last_error = status.get("last_error")
+            self.failures = status.get("failures", 0)
+        return self._latest
+
+    def _run(self):
+        next_poll = 0.0
+        while not self._stop.is_set():
+            if not self.is_loader and self.store.try_acquire_loader():
+                self._become_loader()
+            if self.is_loader and time.monotonic() >= next_poll:
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("Falha ao atualizar dados de %s (tentativa %d)", self.source_key, self.failures)
+                self.store.write_status(last_error=self.last_error, failures=self.failures)
+                next_poll = time.monotonic() + self._next_delay()
+            self._sync_from_store()
+            self._stop.wait(self.sync_interval)
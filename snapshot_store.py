@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local columnar snapshots of the standardized dataset (one file per source set)
+SNAPSHOT_DIR = os.environ.get("GGE_SNAPSHOT_DIR", ".snapshots")
+METADATA_KEY = b"gge_snapshot"
+# Bump whenever standardize_columns changes the shape/dtypes of the frame;
+# snapshots written by an older format are ignored instead of served.
+SNAPSHOT_FORMAT = 3
+
+def snapshot_path(source_key):
+    """
+    Returns the Parquet file used to persist the given source(s).
+    """
+    digest = hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, f"{digest}.parquet")
+
+def _touch_path(source_key):
+    """
+    JSON sidecar holding metadata updated since the snapshot was written.
+    """
+    return f"{snapshot_path(source_key)}.meta.json"
+
+def _with_touched(meta, source_key):
+    """
+    Footer metadata with the sidecar's newer fields, if any.
+    """
+    try:
+        with open(_touch_path(source_key), encoding="utf-8") as f:
+            return {**meta, **json.load(f)}
+    except (OSError, ValueError):
+        return meta
+
+def mixed_object_columns(df):
+    """
+    Object columns holding mixed Python types (e.g. numbers and text coming
+    from the same sheet column), which Arrow cannot encode as-is.
+    """
+    return [
+        c for c in df.columns
+        if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True) not in ("string", "empty")
+    ]
+
+def to_arrow_safe(df, mixed=None):
+    """
+    Casts the mixed object columns to strings so that Arrow can encode them.
+    """
+    mixed = mixed_object_columns(df) if mixed is None else mixed
+    if not mixed:
+        return df
+    return df.astype({c: str for c in mixed})
+
+def save_snapshot(df, source_key, worksheet=None, revision=None):
+    """
+    Atomically writes the frame plus its metadata (source, worksheet, row count,
+    fetch timestamp, change-detection revision) to the local snapshot file.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "source": source_key,
+        "worksheet": worksheet,
+        "row_count": len(df),
+        "fetched_at": time.time(),
+        "revision": revision,
+    }
+    table = pa.Table.from_pandas(to_arrow_safe(df), preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        METADATA_KEY: json.dumps(meta).encode("utf-8"),
+    })
+
+    path = snapshot_path(source_key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    # Updates made to the previous file do not apply to this one
+    try:
+        os.remove(_touch_path(source_key))
+    except FileNotFoundError:
+        pass
+    return meta
+
+def touch_snapshot(source_key, revision=None):
+    """
+    Records that the snapshot's data was confirmed current (new fetch
+    timestamp and revision) without rewriting the Parquet file: the fields
+    go to a small sidecar merged over the footer metadata when read.
+    """
+    path = snapshot_path(source_key)
+    if not os.path.exists(path):
+        return None
+    meta = {"fetched_at": time.time(), "revision": revision}
+    touch_path = _touch_path(source_key)
+    tmp_path = f"{touch_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, touch_path)
+    return meta
+
+def read_snapshot_metadata(source_key):
+    """
+    Reads only the snapshot metadata (footer), or None if there is no snapshot.
+    """
+    path = snapshot_path(source_key)
+    if not os.path.exists(path):
+        return None
+    try:
+        schema_meta = pq.read_schema(path).metadata or {}
+        return _with_touched(json.loads(schema_meta[METADATA_KEY]), source_key)
+    except Exception:
+        return None
+
+def read_snapshot(source_key):
+    """
+    Loads the last snapshot as (DataFrame, metadata), or (None, None) if missing
+    or unreadable.
+    """
+    path = snapshot_path(source_key)
+    if not os.path.exists(path):
+        return None, None
+    try:
+        table = pq.read_table(path, memory_map=True)
+        meta = json.loads((table.schema.metadata or {})[METADATA_KEY])
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            return None, None
+        return table.to_pandas(), _with_touched(meta, source_key)
+    except Exception:
+        return None, None
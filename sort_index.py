@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+class SortIndex:
+    """
+    Row orders precomputed once per dataset version for the sortable columns
+    of the detailed table. A page is then the filtered positions taken in
+    that order and sliced, so only the visible window is ever materialized
+    and sent to the browser.
+    """
+
+    DIMS = ('data_dt', 'unidade', 'status_code')
+
+    def __init__(self, n_rows, orders):
+        self.n_rows = n_rows
+        # column -> (ascending positions of non-null rows, positions of null rows)
+        self.orders = orders
+
+    @classmethod
+    def build(cls, df, dims=DIMS):
+        orders = {}
+        for dim in dims:
+            if dim not in df.columns:
+                continue
+            col = df[dim]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                # Rank of each category (its sort position), looked up by code
+                categories = col.cat.categories
+                rank = np.arange(len(categories)) if col.cat.ordered else np.argsort(np.argsort(categories.astype(str)))
+                codes = col.cat.codes.to_numpy()
+                nulls = codes < 0
+                keys = rank[np.where(nulls, 0, codes)] if len(categories) else codes
+            elif pd.api.types.is_datetime64_any_dtype(col):
+                nulls = col.isna().to_numpy()
+                keys = col.to_numpy().view('i8')
+            else:
+                nulls = col.isna().to_numpy()
+                keys = col.astype(str).to_numpy()
+            valid = np.flatnonzero(~nulls)
+            order = valid[np.argsort(keys[valid], kind='stable')]
+            orders[dim] = (order, np.flatnonzero(nulls))
+        return cls(len(df), orders)
+
+    def order(self, dim, descending=False):
+        """
+        All row positions sorted by ``dim`` (nulls always last); the natural
+        row order if the column is not indexed.
+        """
+        if dim not in self.orders:
+            return np.arange(self.n_rows)
+        order, nulls = self.orders[dim]
+        return np.concatenate([order[::-1] if descending else order, nulls])
+
+    def rows(self, df, positions=None, sort_by=None, descending=False, search=None, search_cols=()):
+        """
+        Positions of the rows to display, in display order: the filtered
+        ``positions`` (None = all rows), sorted, then narrowed to rows where
+        any of ``search_cols`` contains ``search`` (case-insensitive).
+        """
+        order = self.order(sort_by, descending)
+        if positions is not None:
+            keep = np.zeros(self.n_rows, dtype=bool)
+            keep[positions] = True
+            order = order[keep[order]]
+        if search and search.strip():
+            order = order[_search_mask(df, order, search_cols, search.strip().lower())]
+        return order
+
+def _search_mask(df, rows, columns, text):
+    """
+    Substring match restricted to the candidate ``rows``; categorical columns
+    are matched on their (few) categories instead of every row.
+    """
+    mask = np.zeros(len(rows), dtype=bool)
+    for c in columns:
+        if c not in df.columns:
+            continue
+        col = df[c]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            hits = col.cat.categories.astype(str).str.lower().str.contains(text, regex=False)
+            mask |= np.isin(col.cat.codes.to_numpy()[rows], np.flatnonzero(hits))
+            continue
+        if pd.api.types.is_datetime64_any_dtype(col):
+            # Matched as displayed in Brazil (day first), not ISO
+            values = col.take(rows).dt.strftime('%d/%m/%Y %H:%M').fillna("").str.lower()
+        else:
+            values = col.take(rows).astype(str).str.lower()
+        mask |= values.str.contains(text, regex=False).to_numpy()
+    return mask
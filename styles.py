@@ -1,9 +1,66 @@
+import functools
+import io
+import os
+import re
 import streamlit as st
 
+# Static UI assets, served by Streamlit at app/static/ (server.enableStaticServing
+# in .streamlit/config.toml) and cached by the browser instead of being inlined
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+# Vendored Inter variable font (SIL OFL 1.1, license in static/fonts/LICENSE-inter.txt)
+INTER_FONT_FILE = "fonts/InterVariable.woff2"
+# Font Awesome (solid) icons used by the dashboard -> code point in fa-solid-900.woff2
+FA_ICONS = {
+    'database': 'f1c0',
+    'check-circle': 'f058',
+    'school': 'f549',
+    'star': 'f005',
+    'chart-line': 'f201',
+    'list-ul': 'f0ca',
+    'chart-bar': 'f080',
+    'circle-notch': 'f1ce',
+    'clock': 'f017',
+}
+
+def _font_css():
+    """
+    @font-face rules for the vendored fonts plus only the icon classes in use
+    (instead of importing Google Fonts and the full Font Awesome CSS from CDNs).
+    """
+    rules = []
+    if os.path.exists(os.path.join(STATIC_DIR, INTER_FONT_FILE)):
+        rules.append(
+            "@font-face {font-family: 'Inter'; font-style: normal; font-weight: 100 900; font-display: swap; "
+            f"src: local('Inter'), url('{STATIC_URL}/{INTER_FONT_FILE}') format('woff2');}}"
+        )
+    else:
+        # Font file missing from the deploy: fall back to Google Fonts rather than the system font
+        rules.append("@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');")
+    rules.append(
+        "@font-face {font-family: 'Font Awesome 6 Free'; font-style: normal; font-weight: 900; font-display: block; "
+        f"src: url('{STATIC_URL}/fonts/fa-solid-900.woff2') format('woff2');}}"
+    )
+    rules.append(
+        ".fas {font-family: 'Font Awesome 6 Free'; font-weight: 900; font-style: normal; font-variant: normal; "
+        "display: inline-block; line-height: 1; text-rendering: auto; "
+        "-webkit-font-smoothing: antialiased; -moz-osx-font-smoothing: grayscale;}"
+    )
+    rules.extend(f'.fa-{name}:before {{content: "\\{code}";}}' for name, code in FA_ICONS.items())
+    return "\n            ".join(rules)
+
 def apply_gge_styles():
     """
     Applies GGE visual identity using a Premium Glassmorphism Theme.
     """
+    # Byte-identical on every rerun, so the browser's message cache can reuse it
+    st.markdown(gge_css(), unsafe_allow_html=True)
+
+@functools.cache
+def gge_css():
+    """
+    The theme stylesheet, built once per process.
+    """
     # Color Palette - Premium Refined
     gge_blue_deep = "#0A0F1E"
     gge_blue_accent = "#0B3D91"
@@ -13,16 +70,15 @@ def apply_gge_styles():
     gge_glass_bg = "rgba(30, 41, 59, 0.7)"
     gge_glass_border = "rgba(255, 255, 255, 0.1)"
 
-    st.markdown(f"""
+    css = f"""
         <style>
-            @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-            @import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css');
+            {_font_css()}
 
             /* Main Background */
             .stApp {{
                 background: radial-gradient(circle at top left, #1E293B, #0A0F1E);
                 color: {gge_text_main};
-                font-family: 'Inter', sans-serif;
+                font-family: 'Inter', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif;
             }}
             
             /* Glassmorphism Generic Card */
@@ -93,6 +149,21 @@ def apply_gge_styles():
                 font-weight: 400;
             }}
 
+            .kpi-delta {{
+                font-size: 0.75rem;
+                color: {gge_text_muted};
+                margin-top: 6px;
+                font-weight: 600;
+            }}
+
+            .kpi-delta.good {{
+                color: #22C55E;
+            }}
+
+            .kpi-delta.bad {{
+                color: #F87171;
+            }}
+
             /* Custom Header */
             .main-header-container {{
                 background: rgba(11, 61, 145, 0.15);
@@ -264,30 +335,34 @@ def apply_gge_styles():
                 background: {gge_text_muted};
             }}
         </style>
-    """, unsafe_allow_html=True)
+    """
+    # Comments and indentation only cost bytes on the wire
+    return re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", css, flags=re.S)).strip()
+
+# The logo is a static file (fetched once and cached by the browser), not base64 on every rerun
+HEADER_HTML = f"""
+    <div class='main-header-container'>
+        <img src='{STATIC_URL}/logo.jpg' width='140' style='border-radius: 8px; box-shadow: 0 4px 12px rgba(0,0,0,0.2)'>
+        <div class='header-text'>
+            <h1>Painel DOT 7</h1>
+            <p>Monitoramento Colégio GGE</p>
+        </div>
+    </div>
+"""
 
 def render_header():
     """
     Renders the premium dashboard header.
     """
-    logo_path = "assets/logo.jpg"
-    
-    st.markdown(f"""
-        <div class='main-header-container'>
-            <img src='data:image/jpeg;base64,{get_img_base64(logo_path)}' width='140' style='border-radius: 8px; box-shadow: 0 4px 12px rgba(0,0,0,0.2)'>
-            <div class='header-text'>
-                <h1>Painel DOT 7</h1>
-                <p>Monitoramento Colégio GGE</p>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
 
-def get_img_base64(file_path):
-    import base64
-    try:
-        with open(file_path, "rb") as f:
-            data = f.read()
-            return base64.b64encode(data).decode()
-    except:
-        return ""
+@functools.cache
+def _favicon_bytes():
+    with open(os.path.join(STATIC_DIR, "favicon.png"), "rb") as f:
+        return f.read()
 
+def favicon():
+    """
+    Page icon for st.set_page_config, read from disk once per process.
+    """
+    return io.BytesIO(_favicon_bytes())